@@ -0,0 +1,72 @@
+import os
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from groq import Groq
+from supabase import Client, create_client
+from supabase.lib.client_options import SyncClientOptions
+from nba_api.stats.library.http import NBAStatsHTTP
+from NbaResponseStore import NbaResponseStore, StoreSession
+from NbaGateway import NbaGateway
+
+# keep-alive connection pool size per upstream
+POOL_SIZES = {
+    "groq" : int(os.getenv('GROQ_POOL_SIZE', 16)),
+    "supabase" : int(os.getenv('SUPABASE_POOL_SIZE', 16)),
+    "nba" : int(os.getenv('NBA_POOL_SIZE', 8))
+}
+
+# process-wide clients, created on first use and shared by every module
+clients = {}
+clients_lock = threading.RLock()
+
+def get_or_create(name: str, factory):
+    client = clients.get(name)
+    if client is None:
+        with clients_lock:
+            # another thread may have created it while we were waiting
+            client = clients.get(name)
+            if client is None:
+                client = factory()
+                clients[name] = client
+    return client
+
+def pooled_httpx_client(pool_size: int, http2: bool = False) -> httpx.Client:
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.Client(limits=limits, http2=http2, follow_redirects=True)
+
+def get_groq() -> Groq:
+    return get_or_create("groq", lambda: Groq(api_key=os.getenv('GROQ_API_KEY'), http_client=pooled_httpx_client(POOL_SIZES["groq"])))
+
+def get_supabase() -> Client:
+    def create():
+        url = os.environ.get("SUPABASE_URL")
+        key = os.environ.get("SUPABASE_KEY")
+        # one pooled http client shared by the auth and postgrest clients, so it survives the client resets supabase does on sign in
+        # SupabaseAuthSession.ensure is the only thing that refreshes the session. with the client's own refresh timer on as well,
+        # each side would rotate the refresh token out from under the other ("Invalid Refresh Token: Already Used")
+        options = SyncClientOptions(httpx_client=pooled_httpx_client(POOL_SIZES["supabase"], http2=True), auto_refresh_token=False)
+        return create_client(url, key, options=options)
+
+    return get_or_create("supabase", create)
+
+def get_nba_store() -> NbaResponseStore:
+    return get_or_create("nba_store", NbaResponseStore)
+
+def get_nba_gateway() -> NbaGateway:
+    return get_or_create("nba_gateway", NbaGateway)
+
+def get_nba_session() -> requests.Session:
+    def create():
+        # responses are persisted on disk, and can be recorded / replayed for offline runs (see NBA_STORE_MODE).
+        # live requests go through the gateway: shared rate limit, backoff, circuit breaker and latency metrics
+        session = StoreSession(get_nba_store(), get_nba_gateway())
+        adapter = HTTPAdapter(pool_connections=POOL_SIZES["nba"], pool_maxsize=POOL_SIZES["nba"])
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # every nba_api endpoint sends its requests through this session
+        NBAStatsHTTP.set_session(session)
+        return session
+
+    return get_or_create("nba", create)
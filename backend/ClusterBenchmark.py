@@ -0,0 +1,90 @@
+import sys
+import json
+import time
+from sklearn.cluster import DBSCAN
+from sklearn.metrics import adjusted_rand_score, silhouette_score
+from sklearn.preprocessing import StandardScaler
+from EmbeddingService import embedding_service
+from StoryClustering import CLUSTERERS, get_clusterer
+
+# compares the story clustering algorithms on recorded reddit post dumps.
+#   record posts:   python ClusterBenchmark.py record posts.json [pages]
+#   run benchmark:  python ClusterBenchmark.py posts.json [sizes...]
+
+DEFAULT_SIZES = [100, 1000, 10000]
+
+def record_dump(path: str, pages: int = 10) -> None:
+    # append the current listing to the dump, so running this over a few days builds up a large enough sample
+    from RedditPipeline import fetch_posts
+
+    try:
+        with open(path) as f:
+            posts = {post["id"] : post for post in json.load(f)}
+    except FileNotFoundError:
+        posts = {}
+
+    for post in fetch_posts(max_pages=pages):
+        posts.setdefault(post["id"], post)
+
+    with open(path, 'w') as f:
+        json.dump(list(posts.values()), f)
+    print(f'{len(posts)} posts recorded in {path}')
+
+def reference_labels(embeddings):
+    # the original brute force cosine DBSCAN, used as the baseline the other algorithms are scored against
+    return DBSCAN(eps=0.70, min_samples=3, metric="cosine").fit(StandardScaler().fit_transform(embeddings)).labels_
+
+def score(embeddings, labels, reference) -> dict:
+    clustered = labels != -1
+    num_clusters = len(set(labels[clustered]))
+    silhouette = None
+    # silhouette needs at least two clusters, and is sampled to keep it cheap on the big dumps
+    if num_clusters >= 2 and clustered.sum() > num_clusters:
+        silhouette = round(float(silhouette_score(embeddings[clustered], labels[clustered], metric="cosine", sample_size=min(2000, int(clustered.sum())), random_state=0)), 3)
+
+    return {
+        "clusters" : num_clusters,
+        "noise" : round(float(1 - clustered.mean()), 3),
+        "silhouette" : silhouette,
+        "ari_vs_reference" : round(float(adjusted_rand_score(reference, labels)), 3)
+    }
+
+def run_benchmark(path: str, sizes: list = None) -> list:
+    if sizes is None:
+        sizes = DEFAULT_SIZES
+
+    with open(path) as f:
+        posts = json.load(f)
+
+    results = []
+    for size in sizes:
+        if size > len(posts):
+            print(f'Skipping {size} posts, the dump only has {len(posts)}')
+            continue
+
+        sample = posts[:size]
+        embeddings = embedding_service.encode([post["headline"] for post in sample], keys=[post["id"] for post in sample])
+
+        start = time.perf_counter()
+        reference = reference_labels(embeddings)
+        reference_seconds = time.perf_counter() - start
+        results.append({"size" : size, "algorithm" : "dbscan-cosine-brute", "seconds" : round(reference_seconds, 4), **score(embeddings, reference, reference)})
+
+        for name in CLUSTERERS:
+            clusterer = get_clusterer(name)
+            start = time.perf_counter()
+            labels = clusterer.fit_predict(embeddings)
+            seconds = time.perf_counter() - start
+            results.append({"size" : size, "algorithm" : name, "seconds" : round(seconds, 4), **score(embeddings, labels, reference)})
+
+    for result in results:
+        print(result)
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python ClusterBenchmark.py record <dump.json> [pages] | python ClusterBenchmark.py <dump.json> [sizes...]")
+    elif sys.argv[1] == "record":
+        record_dump(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 10)
+    else:
+        run_benchmark(sys.argv[1], [int(size) for size in sys.argv[2:]] or None)
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from postgrest.exceptions import APIError
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from ClientRegistry import get_supabase
+from SupabaseAuth import get_auth_session
+from Newsletter import Newsletter
+from SupabaseWriter import BulkWriter
+from Upstreams import upstream_slot
+
+# one precomputed row per date holding everything /fetchsummaries returns
+DIGEST_TABLE = "Daily Digests"
+
+def build_digest(games_date: str) -> dict:
+    # assemble the bundle from the four source tables. these reads are independent, so run them in parallel
+    newsletter = Newsletter()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        summaries = pool.submit(newsletter.fetch_summaries, games_date)
+        news = pool.submit(newsletter.fetch_news, games_date)
+        highlights = pool.submit(newsletter.fetch_highlights, games_date)
+        standings = pool.submit(newsletter.fetch_standings_changes)
+
+        return {
+            "summaries" : summaries.result(),
+            "news" : news.result(),
+            "highlights" : highlights.result(),
+            "standings" : standings.result()
+        }
+
+def materialize_digest(games_date: str) -> dict:
+    # called by the batch pipelines once they have written their data for the day
+    digest = build_digest(games_date)
+
+    get_auth_session().ensure()
+    writer = BulkWriter(get_supabase())
+    writer.add(DIGEST_TABLE, {
+        "date" : games_date,
+        "digest" : digest,
+        "updated_at" : datetime.now(timezone.utc).isoformat(timespec="seconds")
+    })
+    writer.flush()
+    writer.raise_for_failures()
+
+    notify_api(games_date)
+    return digest
+
+def notify_api(games_date: str) -> None:
+    # tell a running API to drop its cached copy. the pipelines run in their own process, so this goes over http
+    url = os.getenv('DIGEST_INVALIDATE_URL')
+    if not url:
+        return
+
+    try:
+        response = requests.post(url, params={"games_date" : games_date}, headers={"X-Digest-Token" : os.getenv('DIGEST_INVALIDATE_TOKEN', '')}, timeout=5)
+        response.raise_for_status()
+    except Exception as e:
+        # the API cache still expires on its own, so a failed notification only delays the new data
+        print(f'Could not invalidate cached digest for {games_date}: {e}')
+
+class DigestEntry:
+    def __init__(self, digest: dict, last_modified: datetime):
+        self.digest = digest
+        # serialize once so every cache hit hands back the same bytes and the same etag
+        self.body = json.dumps(digest, separators=(",", ":"), default=str).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        # http dates only carry whole seconds
+        self.last_modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+
+    def headers(self) -> dict:
+        return {
+            "ETag" : self.etag,
+            "Last-Modified" : format_datetime(self.last_modified, usegmt=True),
+            # let the browser keep its copy but revalidate it on every page load
+            "Cache-Control" : "no-cache"
+        }
+
+    def not_modified(self, if_none_match: str = None, if_modified_since: str = None) -> bool:
+        # If-None-Match wins over If-Modified-Since when both are sent
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or any(tag.replace("W/", "", 1) == self.etag for tag in tags)
+
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since is None or since.tzinfo is None:
+                return False
+            return self.last_modified <= since
+
+        return False
+
+class DigestCache:
+    def __init__(self, ttl_seconds: float = None, max_entries: int = None):
+        # pipelines invalidate entries when they publish, the ttl only bounds staleness if that notification is missed
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('DIGEST_CACHE_TTL_SECONDS', 15 * 60))
+        if max_entries is None:
+            max_entries = int(os.getenv('DIGEST_CACHE_MAX_ENTRIES', 64))
+
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.supabase = get_supabase()
+        # maps date --> (expiry timestamp, DigestEntry). ordered from least to most recently used
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # one lock per date currently being loaded, so a burst of page views only loads it once
+        self.pending = {}
+        # bumped on every invalidation so a load that started before it is not cached afterwards
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, games_date: str) -> DigestEntry:
+        entry = self._lookup(games_date)
+        if entry is not None:
+            return entry
+
+        with self.lock:
+            key_lock = self.pending.setdefault(games_date, threading.Lock())
+
+        with key_lock:
+            # another request may have loaded this date while we were waiting on the lock
+            entry = self._lookup(games_date, count=False)
+            if entry is not None:
+                return entry
+
+            try:
+                with self.lock:
+                    generation = self.generation
+                entry = self.load(games_date)
+                self._store(games_date, entry, generation)
+            finally:
+                with self.lock:
+                    self.pending.pop(games_date, None)
+
+        return entry
+
+    def load(self, games_date: str) -> DigestEntry:
+        # prefer the bundle the pipelines materialized, and only fall back to the four tables when there is none yet
+        get_auth_session().ensure()
+        try:
+            with upstream_slot("supabase"):
+                response = (
+                    self.supabase.table(DIGEST_TABLE)
+                    .select("*")
+                    .eq("date", games_date)
+                    .limit(1)
+                    .execute()
+                )
+        except APIError as e:
+            # e.g. the table has not been created yet (see schema.sql). the source tables still have everything we need
+            print(f'Could not read {DIGEST_TABLE} for {games_date}, building it from the source tables: {e}')
+            response = None
+
+        if response is not None and response.data:
+            row = response.data[0]
+            return DigestEntry(row["digest"], self.parse_timestamp(row.get("updated_at")))
+
+        return DigestEntry(build_digest(games_date), datetime.now(timezone.utc))
+
+    def parse_timestamp(self, value) -> datetime:
+        try:
+            timestamp = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return datetime.now(timezone.utc)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp
+
+    def _lookup(self, games_date: str, count: bool = True):
+        with self.lock:
+            cached = self.entries.get(games_date)
+            if cached is None or cached[0] <= time.monotonic():
+                self.entries.pop(games_date, None)
+                if count:
+                    self.misses += 1
+                return None
+
+            self.entries.move_to_end(games_date)
+            if count:
+                self.hits += 1
+            return cached[1]
+
+    def _store(self, games_date: str, entry: DigestEntry, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[games_date] = (time.monotonic() + self.ttl_seconds, entry)
+            self.entries.move_to_end(games_date)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, games_date: str = None) -> None:
+        with self.lock:
+            self.generation += 1
+            if games_date is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(games_date, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries" : len(self.entries), "hits" : self.hits, "misses" : self.misses}
+
+digest_cache = DigestCache()
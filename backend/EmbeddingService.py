@@ -0,0 +1,110 @@
+import os
+import hashlib
+import threading
+import numpy as np
+
+class EmbeddingService:
+    def __init__(self, model_name: str = None, batch_size: int = None, num_threads: int = None, cache_path: str = None):
+        if model_name is None:
+            model_name = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+        if batch_size is None:
+            batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', 64))
+        if num_threads is None and os.getenv('EMBEDDING_THREADS'):
+            num_threads = int(os.getenv('EMBEDDING_THREADS'))
+        if cache_path is None:
+            cache_path = os.getenv('EMBEDDING_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'embeddings'))
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        # cpu threads used by torch for inference. None keeps the torch default of one per core
+        self.num_threads = num_threads
+        # directory of the on-disk embedding cache. empty disables it
+        self.cache_path = cache_path
+        self.model = None
+        self.cache = None
+        self.model_lock = threading.Lock()
+        self.cache_lock = threading.Lock()
+        # False once we know sentence_transformers is not installed
+        self.backend_available = True
+        self.cache_hits = 0
+        self.encoded = 0
+
+    def available(self) -> bool:
+        return self.load_model() is not None
+
+    def load_model(self):
+        # loading the model dominates startup, so do it once per process and share it
+        with self.model_lock:
+            if self.model is None and self.backend_available:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    self.backend_available = False
+                    return None
+                if self.num_threads:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+                self.model = SentenceTransformer(self.model_name)
+            return self.model
+
+    def preload(self) -> None:
+        # pay the model load up front, e.g. at API startup, instead of on the first request
+        self.load_model()
+
+    def open_cache(self):
+        if not self.cache_path:
+            return None
+
+        with self.cache_lock:
+            if self.cache is None:
+                from diskcache import Cache
+                self.cache = Cache(self.cache_path)
+            return self.cache
+
+    def cache_key(self, text: str, key: str = None) -> str:
+        # the model name is part of the key so switching models never serves stale vectors
+        if key is None:
+            key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        return f'{self.model_name}:{key}'
+
+    def encode(self, texts: list, keys: list = None, normalize: bool = False, use_cache: bool = True):
+        # returns a (len(texts), dim) float32 matrix. keys (e.g. reddit post ids) identify texts in the cache, otherwise the text hash is used
+        if keys is None:
+            keys = [None] * len(texts)
+        cache = self.open_cache() if use_cache else None
+
+        vectors = [None] * len(texts)
+        cache_keys = [self.cache_key(text, key) for text, key in zip(texts, keys)]
+        if cache is not None:
+            for i, cache_key in enumerate(cache_keys):
+                vectors[i] = cache.get(cache_key)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.cache_hits += len(texts) - len(missing)
+
+        if missing:
+            model = self.load_model()
+            if model is None:
+                raise RuntimeError("sentence_transformers is not installed")
+
+            # only texts we have not seen before are encoded, in batches sized for cpu inference
+            encoded = model.encode([texts[i] for i in missing], batch_size=self.batch_size, convert_to_numpy=True)
+            encoded = np.asarray(encoded, dtype=np.float32)
+            self.encoded += len(missing)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+                if cache is not None:
+                    cache.set(cache_keys[i], vector)
+
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        matrix = np.stack(vectors).astype(np.float32)
+        if normalize:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms > 0, norms, 1.0)
+        return matrix
+
+    def stats(self) -> dict:
+        return {"model" : self.model_name, "loaded" : self.model is not None, "cache_hits" : self.cache_hits, "encoded" : self.encoded}
+
+embedding_service = EmbeddingService()
@@ -0,0 +1,157 @@
+import re
+from dataclasses import dataclass
+import numpy as np
+
+# team stat field --> BoxScoreTraditionalV3 statistics key
+TEAM_STAT_FIELDS = {
+    "points" : "points",
+    "field_goals_made" : "fieldGoalsMade",
+    "field_goals_attempted" : "fieldGoalsAttempted",
+    "field_goal_percentage" : "fieldGoalsPercentage",
+    "three_pointers_made" : "threePointersMade",
+    "three_pointers_attempted" : "threePointersAttempted",
+    "three_pointers_percentage" : "threePointersPercentage",
+    "free_throws_made" : "freeThrowsMade",
+    "free_throws_attempted" : "freeThrowsAttempted",
+    "free_throws_percentage" : "freeThrowsPercentage",
+    "rebounds" : "reboundsTotal",
+    "assists" : "assists",
+    "steals" : "steals",
+    "blocks" : "blocks",
+    "turnovers" : "turnovers"
+}
+
+# player box score columns we keep, with the short label used in prompts
+PLAYER_COLUMNS = {
+    "minutes" : "MIN",
+    "points" : "PTS",
+    "reboundsTotal" : "REB",
+    "assists" : "AST",
+    "steals" : "STL",
+    "blocks" : "BLK",
+    "turnovers" : "TOV",
+    "fieldGoalsMade" : "FGM",
+    "fieldGoalsAttempted" : "FGA",
+    "threePointersMade" : "3PM",
+    "threePointersAttempted" : "3PA",
+    "freeThrowsMade" : "FTM",
+    "freeThrowsAttempted" : "FTA",
+    "plusMinusPoints" : "+/-"
+}
+
+def parse_minutes(value) -> float:
+    # box scores report minutes as "MM:SS" (or an ISO duration like "PT34M12.00S" on the live feed). players who did not play have ""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r"^(\d+):(\d+(?:\.\d+)?)$", value or "") or re.match(r"^PT(\d+)M([\d.]+)S$", value or "")
+    if not match:
+        return 0.0
+    return int(match.group(1)) + float(match.group(2)) / 60
+
+def format_number(value: float) -> str:
+    # whole numbers without a trailing .0, everything else to one decimal
+    return str(int(value)) if float(value).is_integer() else f"{value:.1f}"
+
+class PlayerTable:
+    # columnar player stats for one team: one row per player, keyed by personId
+    __slots__ = ("person_ids", "names", "values", "row_index")
+
+    def __init__(self, person_ids, names: list, values):
+        self.person_ids = np.asarray(person_ids, dtype=np.int64)
+        self.names = list(names)
+        # players x PLAYER_COLUMNS
+        self.values = np.asarray(values, dtype=np.float32).reshape(len(self.names), len(PLAYER_COLUMNS))
+        self.row_index = {int(person_id) : i for i, person_id in enumerate(self.person_ids)}
+
+    @classmethod
+    def from_box_score(cls, players: list):
+        values = []
+        for player in players:
+            statistics = player["statistics"]
+            row = [statistics.get(column) or 0 for column in PLAYER_COLUMNS]
+            row[0] = parse_minutes(statistics.get("minutes"))
+            values.append(row)
+
+        return cls([player["personId"] for player in players], [f'{player["firstName"]} {player["familyName"]}' for player in players], values)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def columns(self, stats: list):
+        # players x stats. stats we do not keep come back as zeros
+        index = {column : i for i, column in enumerate(PLAYER_COLUMNS)}
+        matrix = np.zeros((len(self.names), len(stats)), dtype=np.float64)
+        for j, stat in enumerate(stats):
+            if stat in index:
+                matrix[:, j] = self.values[:, index[stat]]
+        return matrix
+
+    def select(self, rows) -> "PlayerTable":
+        rows = list(rows)
+        return PlayerTable(self.person_ids[rows], [self.names[i] for i in rows], self.values[rows])
+
+    def row(self, person_id: int) -> dict:
+        i = self.row_index[person_id]
+        return {"player_id" : person_id, "name" : self.names[i], **{column : float(value) for column, value in zip(PLAYER_COLUMNS, self.values[i])}}
+
+    def prompt_rows(self, prefix: str) -> list:
+        return [f'{prefix}|{name}|{" ".join(format_number(value) for value in values)}' for name, values in zip(self.names, self.values)]
+
+@dataclass
+class TeamGame:
+    __slots__ = ("team_id", "team_name", "stats", "players")
+    team_id: int
+    team_name: str
+    # TEAM_STAT_FIELDS --> value
+    stats: dict
+    players: PlayerTable
+
+    @classmethod
+    def from_box_score(cls, team: dict):
+        return cls(
+            team_id=team["teamId"],
+            team_name=f'{team["teamCity"]} {team["teamName"]}',
+            stats={field : team["statistics"][key] for field, key in TEAM_STAT_FIELDS.items()},
+            players=PlayerTable.from_box_score(team["players"])
+        )
+
+    def prompt_line(self, side: str) -> str:
+        s = self.stats
+        return (
+            f'{side}: {self.team_name} {s["points"]} | FG {s["field_goals_made"]}/{s["field_goals_attempted"]} {s["field_goal_percentage"]:.3f} '
+            f'| 3P {s["three_pointers_made"]}/{s["three_pointers_attempted"]} {s["three_pointers_percentage"]:.3f} '
+            f'| FT {s["free_throws_made"]}/{s["free_throws_attempted"]} {s["free_throws_percentage"]:.3f} '
+            f'| REB {s["rebounds"]} AST {s["assists"]} STL {s["steals"]} BLK {s["blocks"]} TOV {s["turnovers"]}'
+        )
+
+@dataclass
+class Game:
+    __slots__ = ("game_id", "home", "away")
+    game_id: str
+    home: TeamGame
+    away: TeamGame
+
+    @classmethod
+    def from_box_score(cls, game_id: str, box_score: dict):
+        return cls(game_id=game_id, home=TeamGame.from_box_score(box_score["homeTeam"]), away=TeamGame.from_box_score(box_score["awayTeam"]))
+
+    def teams(self) -> dict:
+        return {"home" : self.home, "away" : self.away}
+
+    def to_prompt(self) -> str:
+        # a few short lines instead of str() of nested dicts: no ids, no quotes or braces, and one header for the player columns
+        lines = [self.home.prompt_line("Home"), self.away.prompt_line("Away"), f'Players (team|name|{" ".join(PLAYER_COLUMNS.values())}):']
+        lines += self.home.players.prompt_rows("Home")
+        lines += self.away.players.prompt_rows("Away")
+        return "\n".join(lines)
+
+    def key_player_ids(self) -> list:
+        return [int(person_id) for person_id in self.home.players.person_ids] + [int(person_id) for person_id in self.away.players.person_ids]
+
+    def player_rows(self) -> list:
+        # one database-ready dict per player
+        rows = []
+        for side, team in self.teams().items():
+            for person_id in team.players.person_ids:
+                rows.append({"game_id" : self.game_id, "team_id" : team.team_id, **team.players.row(int(person_id))})
+        return rows
@@ -0,0 +1,200 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+import requests
+from Upstreams import nba_rate_limiter, upstream_slot
+
+# statuses that mean stats.nba.com is overloaded or throttling us
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# network errors worth another attempt. ssl errors are connection errors
+RETRY_ERRORS = (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError)
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"stats.nba.com is unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    # closed --> requests flow. open --> fail fast until reset_timeout passes. half open --> one trial request decides
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        opened_at = self.opened_at
+        if opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - opened_at))
+
+    def allow(self) -> bool:
+        # returns True when the caller is the half open trial request
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            raise CircuitOpenError(self.retry_after())
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            # a failed trial request, or too many failures in a row, (re)opens the circuit
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+class EndpointMetrics:
+    def __init__(self, window: int = 200):
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.total_seconds = 0.0
+        # most recent latencies, for percentiles
+        self.latencies = deque(maxlen=window)
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+
+        return {
+            "requests" : self.requests,
+            "errors" : self.errors,
+            "throttled" : self.throttled,
+            "mean_seconds" : round(self.total_seconds / self.requests, 3) if self.requests else None,
+            "p50_seconds" : percentile(0.5),
+            "p95_seconds" : percentile(0.95)
+        }
+
+class NbaGateway:
+    def __init__(self, limiter=None, breaker: CircuitBreaker = None, timeout: float = None, attempts: int = None, max_backoff: float = None):
+        if timeout is None:
+            timeout = float(os.getenv('NBA_REQUEST_TIMEOUT_SECONDS', 15))
+        if attempts is None:
+            attempts = int(os.getenv('NBA_REQUEST_ATTEMPTS', 3))
+        if max_backoff is None:
+            max_backoff = float(os.getenv('NBA_MAX_BACKOFF_SECONDS', 30))
+        if breaker is None:
+            breaker = CircuitBreaker(int(os.getenv('NBA_CIRCUIT_FAILURES', 5)), float(os.getenv('NBA_CIRCUIT_RESET_SECONDS', 30)))
+
+        # shared token bucket, so every thread in the process stays under the same request rate
+        self.limiter = limiter if limiter is not None else nba_rate_limiter
+        self.breaker = breaker
+        self.timeout = timeout
+        self.attempts = attempts
+        self.max_backoff = max_backoff
+        # endpoint --> EndpointMetrics
+        self.metrics = {}
+        self.metrics_lock = threading.Lock()
+
+    def endpoint_metrics(self, endpoint: str) -> EndpointMetrics:
+        with self.metrics_lock:
+            return self.metrics.setdefault(endpoint, EndpointMetrics())
+
+    def request(self, send, endpoint: str, timeout: float = None):
+        # send(timeout) performs one live request and returns a requests.Response
+        timeout = min(timeout, self.timeout) if timeout else self.timeout
+
+        # fail fast while stats.nba.com is down instead of piling more requests onto it. the breaker sees one
+        # outcome per call, however many attempts it took, and is always settled so a half open trial cannot get stuck
+        trial = self.breaker.allow()
+        failed = True
+        try:
+            # the trial request gets a single attempt, its outcome alone decides whether the circuit closes
+            response = self.attempt(send, endpoint, timeout, 1 if trial else self.attempts)
+            failed = response.status_code in RETRY_STATUSES
+            return response
+        except CircuitOpenError:
+            # we stopped retrying because other calls opened the circuit. this call never reached the upstream again,
+            # so it must not count as another failure and push the reset time further out
+            failed = None
+            raise
+        finally:
+            if failed:
+                self.breaker.record_failure()
+            elif failed is not None:
+                self.breaker.record_success()
+
+    def attempt(self, send, endpoint: str, timeout: float, attempts: int):
+        metrics = self.endpoint_metrics(endpoint)
+
+        for attempt in range(1, attempts + 1):
+            if attempt > 1 and self.breaker.state != "closed":
+                # other calls tripped the circuit while we were backing off. stop retrying, and leave a half open
+                # circuit to its single trial request
+                raise CircuitOpenError(self.breaker.retry_after())
+            self.limiter.acquire()
+
+            start = time.monotonic()
+            retry_after = None
+            try:
+                with upstream_slot("nba"):
+                    response = send(timeout)
+            except RETRY_ERRORS as e:
+                error, throttled = e, isinstance(e, requests.Timeout)
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.record(metrics, start, error=False)
+                    self.limiter.speed_up()
+                    return response
+                error, throttled = None, response.status_code in THROTTLE_STATUSES
+                retry_after = response.headers.get("Retry-After") if response.headers else None
+                if attempt == attempts:
+                    # out of attempts, hand the error response back to nba_api as it would have been before
+                    self.record(metrics, start, error=True, throttled=throttled)
+                    return response
+
+            self.record(metrics, start, error=True, throttled=throttled)
+            if throttled:
+                # adaptive backoff: slow the shared rate down for every caller, not just this one
+                self.limiter.slow_down()
+            if attempt == attempts:
+                raise error
+
+            time.sleep(self.backoff(attempt, retry_after))
+
+    def backoff(self, attempt: int, retry_after: str = None) -> float:
+        # honour Retry-After when the upstream sends one, otherwise exponential backoff with full jitter
+        if retry_after:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, 2 ** attempt))
+
+    def record(self, metrics: EndpointMetrics, start: float, error: bool, throttled: bool = False) -> None:
+        seconds = time.monotonic() - start
+        with self.metrics_lock:
+            metrics.requests += 1
+            metrics.errors += int(error)
+            metrics.throttled += int(throttled)
+            metrics.total_seconds += seconds
+            metrics.latencies.append(seconds)
+
+    def stats(self) -> dict:
+        with self.metrics_lock:
+            endpoints = {endpoint : metrics.summary() for endpoint, metrics in self.metrics.items()}
+        return {"circuit" : self.breaker.state, "rate" : round(self.limiter.rate, 3), "endpoints" : endpoints}
@@ -0,0 +1,136 @@
+import os
+import time
+import requests
+from datetime import date
+from urllib.parse import urlencode, urlparse
+
+# endpoint --> seconds a stored response stays fresh, for endpoints whose data does not depend on a season parameter
+ENDPOINT_TTLS = {
+    # final box scores never change once the game is over
+    "boxscoretraditionalv3" : 7 * 24 * 60 * 60,
+    "scoreboardv2" : 60 * 60,
+    "leaguestandingsv3" : 60 * 60,
+    "commonplayerinfo" : 24 * 60 * 60,
+    "playerawards" : 24 * 60 * 60
+}
+
+# NBA_STORE_MODE:
+#   cache  --> serve fresh stored responses, fetch and store everything else (default)
+#   record --> always fetch live and store the response as a fixture
+#   replay --> only serve stored responses, never touch the network. a missing response raises
+#   off    --> bypass the store
+STORE_MODES = {"cache", "record", "replay", "off"}
+
+def current_season(today: date = None) -> str:
+    # seasons start in october, e.g. "2025-26"
+    today = today or date.today()
+    start = today.year if today.month >= 10 else today.year - 1
+    return f'{start}-{str(start + 1)[2:]}'
+
+class StoredResponse:
+    # the three attributes nba_api reads off a requests.Response
+    def __init__(self, url: str, status_code: int, text: str):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+class NbaResponseStore:
+    def __init__(self, path: str = None, mode: str = None, current_ttl: float = None, historical_ttl: float = None, size_limit: int = None):
+        if path is None:
+            path = os.getenv('NBA_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'nba_responses'))
+        if mode is None:
+            mode = os.getenv('NBA_STORE_MODE', 'cache')
+        if current_ttl is None:
+            current_ttl = float(os.getenv('NBA_STORE_CURRENT_TTL_SECONDS', 6 * 60 * 60))
+        if historical_ttl is None:
+            historical_ttl = float(os.getenv('NBA_STORE_HISTORICAL_TTL_SECONDS', 30 * 24 * 60 * 60))
+        if size_limit is None:
+            size_limit = int(os.getenv('NBA_STORE_SIZE_LIMIT', 2 ** 30))
+        if( mode not in STORE_MODES ):
+            raise ValueError(f"Unknown NBA_STORE_MODE: {mode}")
+
+        self.path = path
+        self.mode = mode
+        # the current season changes daily, finished seasons effectively never do
+        self.current_ttl = current_ttl
+        self.historical_ttl = historical_ttl
+        self.size_limit = size_limit
+        self.cache = None
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        # diskcache is backed by sqlite, so uvicorn workers and the batch jobs can all share one directory
+        if self.cache is None:
+            from diskcache import Cache
+            self.cache = Cache(self.path, size_limit=self.size_limit)
+        return self.cache
+
+    def key(self, url: str, params) -> str:
+        endpoint = urlparse(url).path.rstrip("/").split("/")[-1].lower()
+        items = sorted(params.items() if isinstance(params, dict) else (params or []))
+        return f'{endpoint}?{urlencode([(name, "" if value is None else value) for name, value in items])}'
+
+    def ttl(self, key: str, params) -> float:
+        endpoint = key.split("?")[0]
+        params = dict(params or [])
+        season = params.get("Season") or params.get("SeasonYear")
+        if season:
+            return self.current_ttl if str(season) >= current_season() else self.historical_ttl
+        return ENDPOINT_TTLS.get(endpoint, self.current_ttl)
+
+    def fetch(self, send, url: str, params):
+        # send() performs the live request and returns a requests.Response
+        if self.mode == "off":
+            return send()
+
+        cache = self.open()
+        key = self.key(url, params)
+        entry = None
+        if self.mode != "record":
+            entry = cache.get(key)
+            if entry is not None and (self.mode == "replay" or time.time() - entry["stored_at"] <= self.ttl(key, params)):
+                self.hits += 1
+                return StoredResponse(entry["url"], entry["status_code"], entry["text"])
+            if self.mode == "replay":
+                raise LookupError(f"No recorded nba_api response for {key}")
+
+        self.misses += 1
+        try:
+            response = send()
+        except Exception as e:
+            # degrade gracefully: a stale response beats an error while stats.nba.com is down or throttling us
+            if entry is None:
+                raise
+            print(f'Serving stale nba_api response for {key}: {e}')
+            return StoredResponse(entry["url"], entry["status_code"], entry["text"])
+
+        if response.status_code != 200 and entry is not None:
+            print(f'Serving stale nba_api response for {key}: status {response.status_code}')
+            return StoredResponse(entry["url"], entry["status_code"], entry["text"])
+
+        # only keep good responses, an error page should never be replayed
+        if response.status_code == 200:
+            cache.set(key, {"url" : response.url, "status_code" : response.status_code, "text" : response.text, "stored_at" : time.time()})
+        return response
+
+    def stats(self) -> dict:
+        return {"mode" : self.mode, "hits" : self.hits, "misses" : self.misses, "entries" : len(self.cache) if self.cache is not None else 0}
+
+class StoreSession(requests.Session):
+    # session handed to nba_api, so every endpoint goes through the response store (and the gateway for live requests) without changing any call sites
+    def __init__(self, store: NbaResponseStore, gateway=None):
+        super().__init__()
+        self.store = store
+        self.gateway = gateway
+
+    def get(self, url, **kwargs):
+        def send():
+            if self.gateway is None:
+                return super(StoreSession, self).get(url, **kwargs)
+
+            def live(timeout):
+                return super(StoreSession, self).get(url, **{**kwargs, "timeout" : timeout})
+            return self.gateway.request(live, self.store.key(url, None).rstrip("?"), timeout=kwargs.get("timeout"))
+
+        return self.store.fetch(send, url, kwargs.get("params"))
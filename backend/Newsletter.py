@@ -2,124 +2,120 @@ from nba_api.stats.static import players
 import nba_api.stats.endpoints as nba_api
 from datetime import date, timedelta, datetime
 import os
-from groq import Groq
-from supabase import Client, create_client
+from ClientRegistry import get_supabase
+from SupabaseAuth import get_auth_session
 import re
+from Upstreams import upstream_slot
 
 class Newsletter:
     def __init__(self):
-        url = os.environ.get("SUPABASE_URL")
-        key = os.environ.get("SUPABASE_KEY")
-        self.supabase = create_client(url, key)
+        # shared, pooled supabase client, so building a Newsletter per request is cheap
+        self.supabase = get_supabase()
         self.summaries = []
         self.news = []
         self.highlights = []
         self.eastern_conference_deltas = {}
         self.western_conference_deltas = {}
-
-    def user_authentication_email(self, email: str, password: str):
-        response = self.supabase.auth.sign_in_with_password(
-            {
-                "email" : email,
-                "password" : password
-            }
-        )
-
-        return response
             
     def fetch_summaries(self, date: str):
-        # HARDCODE AUTH IN FOR NOW
-        user = os.getenv('SUPABASE_ROOT_USER')
-        passw = os.getenv('SUPABASE_ROOT_PW')
-
-        # try to authenticate to write to the database
-        try:
-            auth = self.user_authentication_email(user, passw)
-        except Exception as e:
-            print(e)
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
 
         
-        response = (
-            self.supabase.table("Summaries")
-            .select("*")
-            .eq("date", date)
-            .execute()
-        )
+        with upstream_slot("supabase"):
+            response = (
+                self.supabase.table("Summaries")
+                .select("*")
+                .eq("date", date)
+                .execute()
+            )
 
         self.summaries = response.data
         return self.summaries
     
     def fetch_news(self, date: str):
-        # HARDCODE AUTH IN FOR NOW
-        user = os.getenv('SUPABASE_ROOT_USER')
-        passw = os.getenv('SUPABASE_ROOT_PW')
-
-        # try to authenticate to write to the database
-        try:
-            auth = self.user_authentication_email(user, passw)
-        except Exception as e:
-            print(e)
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
 
         
-        response = (
-            self.supabase.table("News")
-            .select("*")
-            .eq("date", date)
-            .execute()
-        )
+        with upstream_slot("supabase"):
+            response = (
+                self.supabase.table("News")
+                .select("*")
+                .eq("date", date)
+                .execute()
+            )
 
         self.news = response.data
         return self.news
 
     def fetch_highlights(self, date: str):
-        # HARDCODE AUTH IN FOR NOW
-        user = os.getenv('SUPABASE_ROOT_USER')
-        passw = os.getenv('SUPABASE_ROOT_PW')
-
-        # try to authenticate to write to the database
-        try:
-            auth = self.user_authentication_email(user, passw)
-        except Exception as e:
-            print(e)
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
 
         
-        response = (
-            self.supabase.table("Highlights")
-            .select("*")
-            .eq("date", date)
-            .execute()
-        )
+        with upstream_slot("supabase"):
+            response = (
+                self.supabase.table("Highlights")
+                .select("*")
+                .eq("date", date)
+                .execute()
+            )
 
         self.highlights = response.data
         return self.highlights
 
-    def fetch_standings_changes(self):
-        # HARDCODE AUTH IN FOR NOW
-        user = os.getenv('SUPABASE_ROOT_USER')
-        passw = os.getenv('SUPABASE_ROOT_PW')
-
-        # try to authenticate to write to the database
-        try:
-            auth = self.user_authentication_email(user, passw)
-        except Exception as e:
-            print(e)
-
-        # can we enacpsulate this into a single database call?? probably
-
-        response = (
-            self.supabase.table("Standings")
-            .select("*")
-            .execute()
-        )
-
-        back = len(response.data) - 1
-
-        current_standings = response.data[back]
-        prev_standings = response.data[back-1]
+    def fetch_standings_changes(self, window: int = None):
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
+
+        # only fetch the snapshots being compared instead of every row the pipeline has ever written.
+        # with no window, compare the two most recent snapshots. otherwise compare the latest against the newest one at least `window` days older
+        with upstream_slot("supabase"):
+            response = (
+                self.supabase.table("Standings")
+                .select("date, east_rankings, west_rankings")
+                .order("date", desc=True)
+                .limit(2 if window is None else 1)
+                .execute()
+            )
+
+        if not response.data:
+            return {"western_conference_deltas" : {}, "eastern_conference_deltas" : {}}
+
+        current_standings = response.data[0]
+        prev_standings = response.data[1] if len(response.data) > 1 else current_standings
+
+        if window is not None:
+            cutoff = date.fromisoformat(current_standings['date'][:10]) - timedelta(days=window)
+            with upstream_slot("supabase"):
+                response = (
+                    self.supabase.table("Standings")
+                    .select("date, east_rankings, west_rankings")
+                    .lte("date", cutoff.isoformat())
+                    .order("date", desc=True)
+                    .limit(1)
+                    .execute()
+                )
+            # fall back to the oldest data we have when the season has not run that long yet
+            if response.data:
+                prev_standings = response.data[0]
+            else:
+                with upstream_slot("supabase"):
+                    response = (
+                        self.supabase.table("Standings")
+                        .select("date, east_rankings, west_rankings")
+                        .order("date")
+                        .limit(1)
+                        .execute()
+                    )
+                prev_standings = response.data[0]
 
         # calculate the delta in standing positions from prev --> current
 
-        # map each teams id to their positions in the standings from the previous day
+        # map each teams id to their positions in the standings from the previous snapshot
+        self.eastern_conference_deltas = {}
+        self.western_conference_deltas = {}
         for i in range(len(prev_standings['east_rankings'])):
             team_id = prev_standings['east_rankings'][i]
             self.eastern_conference_deltas[team_id] = i + 1
@@ -128,14 +124,14 @@ class Newsletter:
             team_id = prev_standings['west_rankings'][i]
             self.western_conference_deltas[team_id] = i + 1
         
-        # now, calculate the change from their position in the current standings
+        # now, calculate the change from their position in the current standings. a team missing from the old snapshot has not moved
         for i in range(len(current_standings['east_rankings'])):
             team_id = current_standings['east_rankings'][i]
-            self.eastern_conference_deltas[team_id] = [self.eastern_conference_deltas[team_id] - (i + 1), i + 1]
+            self.eastern_conference_deltas[team_id] = [self.eastern_conference_deltas.get(team_id, i + 1) - (i + 1), i + 1]
         
         for i in range(len(current_standings['west_rankings'])):
             team_id = current_standings['west_rankings'][i]
-            self.western_conference_deltas[team_id] = [self.western_conference_deltas[team_id] - (i + 1), i + 1]
+            self.western_conference_deltas[team_id] = [self.western_conference_deltas.get(team_id, i + 1) - (i + 1), i + 1]
 
         # final data is a map of the form team id --> [change in standings, cur position in standings]
         return {
@@ -2,11 +2,16 @@ from nba_api.stats.static import players
 import nba_api.stats.endpoints as nba_api
 from datetime import date, timedelta
 import os
-from groq import Groq
-from supabase import Client, create_client
-import re
-import CommonLeagueInfo
+from ClientRegistry import get_groq, get_supabase, get_nba_session
+from SupabaseAuth import get_auth_session
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from Upstreams import GROQ_TRANSIENT_ERRORS, call_with_retries, groq_rate_limiter, upstream_slot
+from SupabaseWriter import BulkWriter
+from PlayerRanking import PerformanceRanker
+from GameData import Game
+from PromptCompactor import PromptCompactor
 
 #NOTE: need to set up a daily batch job that runs the summary generation
 
@@ -18,46 +23,80 @@ class NewsletterTools:
         self.game_summaries = {}
         self.west_standings = []
         self.east_standings = []
-        self.player_performance_weights = {
-            'points' : 1.0,
-            'assists' : 0.75,
-            'reboundsTotal' : 0.75,
-            'plusMinusPoints' : 0.5,
-            'blocks' : 0.65,
-            'steals' : 0.65,
-            'turnovers' : -1.0,
-            'threePointersAttempted' : -0.60,
-            'threePointersMade' : 0.50,
-            'fieldGoalsAttempted' : -0.50,
-            'fieldGoalsMade' : 0.40,
-            'freeThrowsAttempted' : -0.20,
-            'freeThrowsMade' : 0.10
-        }
+        self.team_snapshots = []
+        #NOTE: this should be modular so we should not need to hard-code the season... but for now let's do that
+        self.season = "2025-26"
+        # per game fetch timings / failures for the run report
+        self.fetch_report = {}
+        self.max_concurrent_fetches = int(os.getenv('BOX_SCORE_WORKERS', 4))
+        # scores players with one dot product per night and keeps the top k per team
+        self.ranker = PerformanceRanker()
+        self.player_performance_weights = self.ranker.weights
 
-        self.client = Groq(api_key=os.getenv('GROQ_API_KEY'))
-        self.messages = [
-            {
-                "role" : "system",
-                "content" : "You are an expert NBA Analyst that is tasked with providing a high level summary of NBA games. Please stick to only the statistics you are provided with, and do not rely on anything else for numbers you write in the summary. Don't make any assumptions about the data, like game-high, team-high, etc. Ignore all IDs. A summary should have the following format, keep the capitalized words in as headers: SCOREWinnigTeam Score, LosingTeam ScoreDETAILSProvide details of the game.KEY PERFORMERSProvide details of the players who performed the best! Don't just purely write their stats here. Each player should be on their own line starting with -"
+        # shared, pooled Groq client
+        self.client = get_groq()
+        self.system_message = {
+            "role" : "system",
+            "content" : "You are an expert NBA Analyst that is tasked with providing a high level summary of NBA games. Please stick to only the statistics you are provided with, and do not rely on anything else for numbers you write in the summary. Don't make any assumptions about the data, like game-high, team-high, etc. Each game is given as one line per team (H is home, A is away) followed by a table of its key players. Respond with a JSON object with the following fields: score is the final score in the form WinningTeam Score, LosingTeam Score. details provides details of the game. key_performers is a list with one entry per player who performed the best, describing their game! Don't just purely write their stats here."
+        }
+        # the model is asked for structured output, so summaries no longer need to be regex-parsed
+        self.summary_format = {
+            "type" : "json_schema",
+            "json_schema" : {
+                "name" : "game_summary",
+                "schema" : {
+                    "type" : "object",
+                    "properties" : {
+                        "score" : {"type" : "string"},
+                        "details" : {"type" : "string"},
+                        "key_performers" : {"type" : "array", "items" : {"type" : "string"}}
+                    },
+                    "required" : ["score", "details", "key_performers"],
+                    "additionalProperties" : False
+                }
             }
-        ]
+        }
         self.model = "moonshotai/kimi-k2-instruct-0905"
+        self.max_concurrent_summaries = int(os.getenv('SUMMARY_WORKERS', 4))
+        self.summary_errors = {}
+        # trims each game's prompt to PROMPT_TOKEN_BUDGET tokens. id_key --> {"tokens", "full_tokens"} for the run report
+        self.compactor = PromptCompactor()
+        self.prompt_tokens = {}
 
-        url = os.environ.get("SUPABASE_URL")
-        key = os.environ.get("SUPABASE_KEY")
-        self.supabase = create_client(url, key)
+        self.supabase = get_supabase()
+        # route nba_api requests through the shared keep-alive session
+        get_nba_session()
+        # rows are buffered per table and written in batches
+        self.writer = BulkWriter(self.supabase)
 
     def get_standings(self) -> None:
-        #NOTE: this should be modular so we should not need to hard-code the season... but for now let's do that
-        cur_season = "2025-26"
-        df = nba_api.LeagueStandingsV3(season=cur_season, season_type="Regular Season").get_data_frames()[0]
+        # a single league wide call gives us the standings and every team's snapshot
+        df = nba_api.LeagueStandingsV3(season=self.season, season_type="Regular Season").get_data_frames()[0]
+        self.west_standings = []
+        self.east_standings = []
+        self.team_snapshots = []
         # teams are given in ascending record order --> can simply be appended to each array this way without the need for sorting
         for index, row in df.iterrows():
+            # need to handle some explicity type casting from numpy 64-bit ints and floats
+            self.team_snapshots.append({
+                "team_id" : int(row["TeamID"]),
+                "season" : self.season,
+                "city" : row["TeamCity"],
+                "team_name" : row["TeamName"],
+                "conference" : row["Conference"],
+                "division" : row["Division"],
+                "wins" : int(row["WINS"]),
+                "losses" : int(row["LOSSES"]),
+                "win_pct" : float(row["WinPCT"]),
+                "conference_standing" : int(row["PlayoffRank"]),
+                "date" : self.date
+            })
+
             # store team ID in these tuples so that we can easily access pictures of each team NOTE TO SELF: maybe make this a database object (idea, these don't really change no reason to fetch every time we want to display)
             if row["Conference"] == "West":
-                self.west_standings.append(row["TeamID"])
+                self.west_standings.append(int(row["TeamID"]))
             elif row["Conference"] == "East":
-                self.east_standings.append(row["TeamID"])
+                self.east_standings.append(int(row["TeamID"]))
             else:
                 raise ValueError("Error during data gathering stage for updated NBA Standings.")     
 
@@ -69,233 +108,142 @@ class NewsletterTools:
         for index, row in df.iterrows():
             self.game_ids[row["GAME_ID"]] = None
 
+    def fetch_box_score(self, id_key: str) -> dict:
+        # rate limiting, retries and backoff happen in the nba gateway under the shared session
+        start = time.monotonic()
+        df = nba_api.BoxScoreTraditionalV3(game_id=id_key).get_dict()
+        self.fetch_report[id_key] = {"status" : "ok", "seconds" : round(time.monotonic() - start, 3)}
+
+        return df["boxScoreTraditional"]
+
     def get_game_details(self) -> None:
-        for id_key in self.game_ids:
-            df = nba_api.BoxScoreTraditionalV3(game_id=id_key).get_dict()
-            df = df["boxScoreTraditional"]
-
-            home_team_stats = {
-                'team_name' : f'{df["homeTeam"]["teamCity"]} {df["homeTeam"]["teamName"]}',
-                'team_id' : df["homeTeam"]["teamId"],
-                'points' : df["homeTeam"]["statistics"]["points"],
-                'field_goals_made' : df["homeTeam"]["statistics"]["fieldGoalsMade"],
-                'field_goals_attempted' : df["homeTeam"]["statistics"]["fieldGoalsAttempted"],
-                'field_goal_percentage' : df["homeTeam"]["statistics"]["fieldGoalsPercentage"],
-                'three_pointers_made' : df["homeTeam"]["statistics"]["threePointersMade"],
-                'three_pointers_attempted' : df["homeTeam"]["statistics"]["threePointersAttempted"],
-                'three_pointers_percentage' : df["homeTeam"]["statistics"]["threePointersPercentage"],
-                'free_throws_made' : df["homeTeam"]["statistics"]["freeThrowsMade"],
-                'free_throws_attempted' : df["homeTeam"]["statistics"]["freeThrowsAttempted"],
-                'free_throws_percentage' : df["homeTeam"]["statistics"]["freeThrowsPercentage"],
-                'rebounds' : df["homeTeam"]["statistics"]["reboundsTotal"],
-                'assists' : df["homeTeam"]["statistics"]["assists"],
-                'steals' : df["homeTeam"]["statistics"]["steals"],
-                'blocks' : df["homeTeam"]["statistics"]["blocks"],
-                'turnovers' : df["homeTeam"]["statistics"]["turnovers"],
-                'player_stats' : {}
-            }
+        # fetch every box score concurrently. a slow or failing game only affects itself
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_fetches) as executor:
+            futures = {executor.submit(self.fetch_box_score, id_key) : (id_key, time.monotonic()) for id_key in self.game_ids}
 
+            for future in as_completed(futures):
+                id_key, submitted_at = futures[future]
+                try:
+                    df = future.result()
+                except Exception as e:
+                    self.fetch_report[id_key] = {"status" : "failed", "seconds" : round(time.monotonic() - submitted_at, 3), "error" : str(e)}
+                    continue
 
-            for player in df["homeTeam"]["players"]:
-                id = player["personId"]
-                name = f'{player["firstName"]} {player["familyName"]}'
-                home_team_stats["player_stats"][name] = player["statistics"]
-                # add the players id to the dictionary
-                home_team_stats["player_stats"][name]["player_id"] = id
-            
-            away_team_stats = {
-                'team_name' : f'{df["awayTeam"]["teamCity"]} {df["awayTeam"]["teamName"]}',
-                'team_id' : df["awayTeam"]["teamId"],
-                'points' : df["awayTeam"]["statistics"]["points"],
-                'field_goals_made' : df["awayTeam"]["statistics"]["fieldGoalsMade"],
-                'field_goals_attempted' : df["awayTeam"]["statistics"]["fieldGoalsAttempted"],
-                'field_goal_percentage' : df["awayTeam"]["statistics"]["fieldGoalsPercentage"],
-                'three_pointers_made' : df["awayTeam"]["statistics"]["threePointersMade"],
-                'three_pointers_attempted' : df["awayTeam"]["statistics"]["threePointersAttempted"],
-                'three_pointers_percentage' : df["awayTeam"]["statistics"]["threePointersPercentage"],
-                'free_throws_made' : df["awayTeam"]["statistics"]["freeThrowsMade"],
-                'free_throws_attempted' : df["awayTeam"]["statistics"]["freeThrowsAttempted"],
-                'free_throws_percentage' : df["awayTeam"]["statistics"]["freeThrowsPercentage"],
-                'rebounds' : df["awayTeam"]["statistics"]["reboundsTotal"],
-                'assists' : df["awayTeam"]["statistics"]["assists"],
-                'steals' : df["awayTeam"]["statistics"]["steals"],
-                'blocks' : df["awayTeam"]["statistics"]["blocks"],
-                'turnovers' : df["awayTeam"]["statistics"]["turnovers"],
-                'player_stats' : {}
-            }
+                self.game_ids[id_key] = self.build_game_details(id_key, df)
 
-            for player in df["awayTeam"]["players"]:
-                id = player["personId"]
-                name = f'{player["firstName"]} {player["familyName"]}'
-                away_team_stats["player_stats"][name] = player["statistics"]
-                # add the players id to the dictionary
-                away_team_stats["player_stats"][name]["player_id"] = id
+        # drop the games we could not fetch so the rest of the pipeline only sees complete games
+        for id_key, report in self.fetch_report.items():
+            if report["status"] == "failed":
+                self.game_ids.pop(id_key, None)
 
-            # map game id to its relevant statistics
-            self.game_ids[id_key] = {'home_team_stats' : home_team_stats, 'away_team_stats' : away_team_stats}
+    def build_game_details(self, id_key: str, df: dict) -> Game:
+        # compact typed game: team stats in a slotted dataclass, player stats in a columnar table keyed by personId
+        return Game.from_box_score(id_key, df)
 
-    
     def rank_players_for_game(self):
-        # for testing, extract the id of the first game and store in a variable 
-        for id_key in self.game_ids:
-            player_game_scores = []
-            for player in self.game_ids[id_key]['home_team_stats']['player_stats']:
-                score = 0.0
-                for stat in self.player_performance_weights:
-                    score += (self.game_ids[id_key]['home_team_stats']['player_stats'][player][stat] * self.player_performance_weights[stat])
-                
-                player_game_scores.append((score, player))
-            
-            player_game_scores.sort()
-            # delete all the player statistics except the 2 highest performers 
-            i = 0
-            for score, player in player_game_scores:
-                # if we are on one of the two highest performers, keep their game information 
-                if i >= len(player_game_scores) - 2:
-                    continue
-                # delete all other players stats to save token consumption
-                del self.game_ids[id_key]['home_team_stats']['player_stats'][player]
-                i += 1
-
-            player_game_scores = []
-            for player in self.game_ids[id_key]['away_team_stats']['player_stats']:
-                score = 0.0
-                for stat in self.player_performance_weights:
-                    score += (self.game_ids[id_key]['away_team_stats']['player_stats'][player][stat] * self.player_performance_weights[stat])
-                
-                player_game_scores.append((score, player))
-            
-            player_game_scores.sort()
-            # delete all the player statistics except the 2 highest performers 
-            i = 0
-            for score, player in player_game_scores:
-                # if we are on one of the two highest performers, keep their game information 
-                if i >= len(player_game_scores) - 2:
-                    continue
-                # delete all other players stats to save token consumption
-                del self.game_ids[id_key]['away_team_stats']['player_stats'][player]
-                i += 1
-
-    def generate_game_summary(self):
-        for id_key in self.game_ids:
-            self.messages.append({
-                "role" : "user",
-                "content" : str(self.game_ids[id_key])
-            })
+        # every box score for the night is scored at once, then only the top players of each team are kept to save token consumption
+        ranked = self.ranker.rank_games(self.game_ids)
+        for id_key, teams in ranked.items():
+            for side, team in self.game_ids[id_key].teams().items():
+                # keep the best players, best first, so prompt compaction drops the weakest rows first
+                team.players = team.players.select(teams[side])
+
+    def generate_game_summary(self, id_key: str) -> dict:
+        prompt, tokens = self.compactor.compact(self.game_ids[id_key])
+        self.prompt_tokens[id_key] = {"tokens" : tokens, "full_tokens" : self.compactor.count_tokens(self.game_ids[id_key].to_prompt())}
+        messages = [self.system_message, {"role" : "user", "content" : prompt}]
+
+        def request():
+            # share the groq rate limit and concurrency cap with every other groq call in the process
+            groq_rate_limiter.acquire()
+            with upstream_slot("groq"):
+                # send a request to the model 
+                chat_completion = self.client.chat.completions.create(
+                    messages = messages,
+                    model = self.model,
+                    temperature = 0.35,
+                    response_format = self.summary_format
+                )
+            summary = json.loads(chat_completion.choices[0].message.content)
+            if not isinstance(summary, dict) or not {"score", "details", "key_performers"} <= summary.keys():
+                raise ValueError(f"Malformed summary: {summary}")
+            return summary
 
-            # send a request to the model 
-            chat_completion = self.client.chat.completions.create(
-                messages = self.messages,
-                model = self.model,
-                temperature = 0.35
-            )
+        # a malformed response or a transient groq error gets one more try before we give up on the game.
+        # auth and bad request errors fail straight away (json.JSONDecodeError is a ValueError)
+        return call_with_retries(request, attempts=2, retryable=lambda e: isinstance(e, (ValueError,) + GROQ_TRANSIENT_ERRORS))
 
-            # capture the classification
-            summary = chat_completion.choices[0].message.content
-            # pop the query from the message history
-            self.messages.pop()
-            self.game_summaries[id_key] = summary
+    def generate_game_summaries(self, on_summary=None) -> None:
+        # summarize every game concurrently, handing each summary to on_summary as soon as it is ready
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_summaries) as executor:
+            futures = {executor.submit(self.generate_game_summary, id_key) : id_key for id_key in self.game_ids}
+
+            for future in as_completed(futures):
+                id_key = futures[future]
+                try:
+                    self.game_summaries[id_key] = future.result()
+                except Exception as e:
+                    # one bad game should not cost us the rest of the night
+                    self.summary_errors[id_key] = str(e)
+                    print(f'Error generating summary for game {id_key}: {e}')
+                    continue
+
+                if on_summary is not None:
+                    on_summary(id_key)
 
     def write_team_snapshots(self):
-        # HARDCODE AUTH IN FOR NOW
-        user = os.getenv('SUPABASE_ROOT_USER')
-        passw = os.getenv('SUPABASE_ROOT_PW')
-
-        # try to authenticate to write to the database
-        try:
-            auth = self.user_authentication_email(user, passw)
-        except Exception as e:
-            print(e)
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
         
-        # loop through each team and take a snapshot of their common info, including wins, losses, and conference standing
-        for team in CommonLeagueInfo.TEAM_IDS:
-            df = nba_api.TeamInfoCommon(team).get_data_frames()[0]
-            # need to handle some explicity type casting from numpy 64-bit ints and floats
-            database_fields_map = {
-                "team_id" : int(df["TEAM_ID"].values[0]),
-                "season" : df["SEASON_YEAR"].values[0],
-                "city" : df["TEAM_CITY"].values[0],
-                "team_name" : df["TEAM_NAME"].values[0],
-                "conference" : df["TEAM_CONFERENCE"].values[0],
-                "division" : df["TEAM_DIVISION"].values[0],
-                "wins" : int(df["W"].values[0]),
-                "losses" : int(df["L"].values[0]),
-                "win_pct" : float(df["PCT"].values[0]),
-                "conference_standing" : int(df["CONF_RANK"].values[0]),
-                "date" : self.date
-            }
-            
-            response = self.supabase.table("Team Snapshots").insert(database_fields_map).execute()
-            print(response)
+        # snapshots come from the same standings frame, so only fetch it if get_standings has not run yet
+        if not self.team_snapshots:
+            self.get_standings()
 
-            # avoid repeatedly spamming the API which was causing some blocking issues by sleeping the process for a second
-            time.sleep(1)
-            
-    def user_authentication_email(self, email: str, password: str):
-        response = self.supabase.auth.sign_in_with_password(
-            {
-                "email" : email,
-                "password" : password
-            }
-        )
+        for snapshot in self.team_snapshots:
+            self.writer.add("Team Snapshots", snapshot)
 
-        return response
+        self.writer.flush("Team Snapshots")
             
     def write_summaries(self):
-        # HARDCODE AUTH IN FOR NOW
-        user = os.getenv('SUPABASE_ROOT_USER')
-        passw = os.getenv('SUPABASE_ROOT_PW')
-
-        # try to authenticate to write to the database
-        try:
-            auth = self.user_authentication_email(user, passw)
-        except Exception as e:
-            print(e)
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
 
         for id_key in self.game_summaries:
-            # need to write some regex to extract each key part of a summary out
-            pattern = re.compile(r"(?s)SCORE\s*(.*?)\s*DETAILS\s*(.*?)\s*KEY PERFORMERS\s*(.*)")
-
-            match = pattern.search(self.game_summaries[id_key])
-
-            if match:
-                score = match.group(1).strip()
-                details = match.group(2).strip()
-                key_performers = match.group(3).strip()
-                key_performers = key_performers.split("\n")
-                key_performers = [item.strip() for item in key_performers if item.strip()]
-                database_fields_map = {
-                    'game_id' : id_key,
-                    'home_team_id' : self.game_ids[id_key]['home_team_stats']['team_id'],
-                    'away_team_id' : self.game_ids[id_key]['away_team_stats']['team_id'],
-                    'headline' : score,
-                    'game_description' : details,
-                    'key_player_ids' : [],
-                    'key_player_descriptions' : key_performers,
-                    'date' : self.date
-                }
+            self.write_summary(id_key)
 
-                # add player ids to database object
-                for player in self.game_ids[id_key]['home_team_stats']['player_stats']:
-                    database_fields_map['key_player_ids'].append(self.game_ids[id_key]['home_team_stats']['player_stats'][player]['player_id'])
-                for player in self.game_ids[id_key]['away_team_stats']['player_stats']:
-                    database_fields_map['key_player_ids'].append(self.game_ids[id_key]['away_team_stats']['player_stats'][player]['player_id'])
+        self.writer.flush("Summaries")
 
-                response = self.supabase.table("Summaries").insert(database_fields_map).execute()
-                print(response)
-            else:
-                print(f'Error generating summary, see details:\n{self.game_summaries[id_key]}')
+    def summarize_and_write(self):
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
 
-    def write_standings(self):
-        # HARDCODE AUTH IN FOR NOW
-        user = os.getenv('SUPABASE_ROOT_USER')
-        passw = os.getenv('SUPABASE_ROOT_PW')
+        # each summary is written as soon as it is generated, rather than after the slowest game finishes
+        self.generate_game_summaries(on_summary=self.write_summary)
+        self.writer.flush("Summaries")
 
-        # try to authenticate to write to the database
-        try:
-            auth = self.user_authentication_email(user, passw)
-        except Exception as e:
-            print(e)
+    def write_summary(self, id_key: str):
+        summary = self.game_summaries[id_key]
+        key_performers = [item.strip() for item in summary["key_performers"] if item.strip()]
+        # keep the "- " bullet the stored descriptions have always had
+        key_performers = [item if item.startswith('-') else f'- {item}' for item in key_performers]
+        database_fields_map = {
+            'game_id' : id_key,
+            'home_team_id' : self.game_ids[id_key].home.team_id,
+            'away_team_id' : self.game_ids[id_key].away.team_id,
+            'headline' : summary["score"].strip(),
+            'game_description' : summary["details"].strip(),
+            # ids of the players kept by rank_players_for_game
+            'key_player_ids' : self.game_ids[id_key].key_player_ids(),
+            'key_player_descriptions' : key_performers,
+            'date' : self.date
+        }
+
+        # buffered, and sent along with the other summaries once the batch fills or the run ends
+        self.writer.add("Summaries", database_fields_map)
+
+    def write_standings(self):
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
 
         database_fields_map = {
             "date" : self.date,
@@ -303,5 +251,23 @@ class NewsletterTools:
             "west_rankings" : self.west_standings
         }
 
-        response = self.supabase.table("Standings").insert(database_fields_map).execute()
-        print(response)
\ No newline at end of file
+        self.writer.add("Standings", database_fields_map)
+        self.writer.flush("Standings")
+
+    def write_standings_and_snapshots(self):
+        # sign in once per process and reuse the cached session
+        get_auth_session().ensure()
+
+        if not self.team_snapshots:
+            self.get_standings()
+
+        # the standings row and every team snapshot go out together in one flush
+        self.writer.add("Standings", {
+            "date" : self.date,
+            "east_rankings" : self.east_standings,
+            "west_rankings" : self.west_standings
+        })
+        for snapshot in self.team_snapshots:
+            self.writer.add("Team Snapshots", snapshot)
+
+        self.writer.flush()
\ No newline at end of file
@@ -1,4 +1,5 @@
 from PlayerTools import PlayerTools
+from concurrent.futures import ThreadPoolExecutor
 
 class PlayerCard:
     def __init__(self, player_name: str):
@@ -11,17 +12,22 @@ class PlayerCard:
         self.player_image_url = f'https://ak-static.cms.nba.com/wp-content/uploads/headshots/nba/latest/260x190/{self.id}.png'
 
         # TODO: implement self.image        
-        # fetch the player info for the card banner 
-        self.team = self.tools.get_player_team(self.id, self.player_name)["raw_stat"]
-        self.position = self.tools.get_player_position(self.id, self.player_name)["raw_stat"]
-        self.jersey_number = self.tools.get_player_jersey_number(self.id, self.player_name)["raw_stat"]
-        self.jersey_number = '#' + self.jersey_number
+        # the banner info, awards and career stats come from independent endpoints, so fetch them concurrently
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            banner_future = executor.submit(self.tools.get_common_player_info_items, self.id, ["TEAM_NAME", "POSITION", "JERSEY"])
+            awards_future = executor.submit(self.tools.get_player_awards, self.id)
+            career_future = executor.submit(self.tools.get_player_career_stats_totals, self.id)
 
-        # fetch awards for award section
-        self.awards = self.tools.get_player_awards(self.id)
+            # fetch the player info for the card banner from a single common player info response
+            banner = banner_future.result()
+            # fetch awards for award section
+            self.awards = awards_future.result()
+            # fetch career statistics for stats section
+            self.career_stats = career_future.result()
 
-        # fetch career statistics for stats section
-        self.career_stats = self.tools.get_player_career_stats_totals(self.id)
+        self.team = banner["TEAM_NAME"]
+        self.position = banner["POSITION"]
+        self.jersey_number = '#' + banner["JERSEY"]
         
     def build_player_card(self):
         games_played = self.career_stats["GP"].item()
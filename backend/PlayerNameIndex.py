@@ -0,0 +1,161 @@
+import re
+import heapq
+import unicodedata
+from collections import Counter
+from nba_api.stats.static import players
+
+# common nicknames and short forms users search with, mapped to the player's full name in the static player list
+PLAYER_ALIASES = {
+    "king james" : "LeBron James",
+    "bron" : "LeBron James",
+    "greek freak" : "Giannis Antetokounmpo",
+    "giannis" : "Giannis Antetokounmpo",
+    "the beard" : "James Harden",
+    "steph curry" : "Stephen Curry",
+    "chef curry" : "Stephen Curry",
+    "kd" : "Kevin Durant",
+    "the joker" : "Nikola Jokic",
+    "jokic" : "Nikola Jokic",
+    "ad" : "Anthony Davis",
+    "the brow" : "Anthony Davis",
+    "cp3" : "Chris Paul",
+    "mj" : "Michael Jordan",
+    "jordan" : "Michael Jordan",
+    "shaq" : "Shaquille O'Neal",
+    "kobe" : "Kobe Bryant",
+    "black mamba" : "Kobe Bryant",
+    "the mailman" : "Karl Malone",
+    "dame" : "Damian Lillard",
+    "sga" : "Shai Gilgeous-Alexander",
+    "luka" : "Luka Doncic",
+    "wemby" : "Victor Wembanyama",
+    "kat" : "Karl-Anthony Towns",
+    "pg13" : "Paul George",
+    "melo" : "Carmelo Anthony",
+    "d wade" : "Dwyane Wade",
+    "ant man" : "Anthony Edwards",
+    "jimmy buckets" : "Jimmy Butler",
+    "the process" : "Joel Embiid",
+    "zion" : "Zion Williamson",
+    "jjj" : "Jaren Jackson Jr."
+}
+
+NAME_SUFFIXES = {"jr", "sr", "ii", "iii", "iv", "v"}
+
+def normalize_name(name: str) -> str:
+    # strip accents, lowercase, drop periods/apostrophes and treat hyphens as spaces. e.g. "B.J. Armstrong" --> "bj armstrong"
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(ch for ch in name if not unicodedata.combining(ch))
+    name = re.sub(r"[.'’]", "", name.lower())
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return " ".join(name.split())
+
+def strip_suffix(name: str) -> str:
+    # "jaren jackson jr" --> "jaren jackson"
+    tokens = name.split()
+    while len(tokens) > 1 and tokens[-1] in NAME_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)
+
+def name_ngrams(name: str, n: int = 3) -> set:
+    # character n-grams of the padded name, so word boundaries contribute to the match
+    padded = f'  {name} '
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+class PlayerNameIndex:
+    def __init__(self, player_list: list = None, min_fuzzy_score: float = 0.55):
+        if player_list is None:
+            player_list = players.get_players()
+
+        # active players first, otherwise the static list order, so name collisions resolve to the player people most likely mean
+        self.players = sorted(player_list, key=lambda player: not player["is_active"])
+        self.min_fuzzy_score = min_fuzzy_score
+
+        # normalized name --> player positions, in preference order. stripped_names is keyed without suffixes and
+        # only used as a fallback, so "gary payton" stays Gary Payton instead of the active Gary Payton II
+        self.full_names = {}
+        self.stripped_names = {}
+        self.last_names = {}
+        self.aliases = {}
+        self.normalized = []
+        # inverted index of character n-gram --> player positions
+        self.ngram_postings = {}
+        self.ngram_counts = []
+
+        for position, player in enumerate(self.players):
+            full_name = normalize_name(player["full_name"])
+            self.normalized.append(full_name)
+
+            self.full_names.setdefault(full_name, []).append(position)
+            self.stripped_names.setdefault(strip_suffix(full_name), []).append(position)
+
+            last_name = strip_suffix(normalize_name(player["last_name"]))
+            if last_name:
+                self.last_names.setdefault(last_name, []).append(position)
+
+            grams = name_ngrams(full_name)
+            self.ngram_counts.append(len(grams))
+            for gram in grams:
+                self.ngram_postings.setdefault(gram, []).append(position)
+
+        for alias, full_name in PLAYER_ALIASES.items():
+            positions = self.full_names.get(normalize_name(full_name))
+            if positions:
+                self.aliases[normalize_name(alias)] = positions[0]
+
+    def exact(self, name: str):
+        key = normalize_name(name)
+        positions = self.full_names.get(key) or self.stripped_names.get(strip_suffix(key))
+        if positions:
+            return self.players[positions[0]]
+
+        if key in self.aliases:
+            return self.players[self.aliases[key]]
+
+        return None
+
+    def search(self, name: str, k: int = 5) -> list:
+        # returns up to k (score, player) pairs, best first. score is the dice coefficient of the character n-grams
+        key = normalize_name(name)
+        if not key:
+            return []
+
+        grams = name_ngrams(key)
+        overlaps = Counter()
+        for gram in grams:
+            for position in self.ngram_postings.get(gram, ()):
+                overlaps[position] += 1
+
+        # ties go to the earlier position, which is already the preferred (active / most recent) player
+        scored = (
+            (2.0 * overlap / (len(grams) + self.ngram_counts[position]), -position)
+            for position, overlap in overlaps.items()
+        )
+        best = heapq.nlargest(k, scored)
+
+        return [(round(score, 4), self.players[-neg_position]) for score, neg_position in best]
+
+    def resolve(self, name: str):
+        # O(1) exact / alias hit first, then an unambiguous last name, then the best fuzzy match above the threshold
+        player = self.exact(name)
+        if player is not None:
+            return player
+
+        # a lone last name only counts when it is unambiguous among active players (or among all players)
+        key = strip_suffix(normalize_name(name))
+        positions = self.last_names.get(key, [])
+        active = [position for position in positions if self.players[position]["is_active"]]
+        if len(active) == 1 or len(positions) == 1:
+            return self.players[(active or positions)[0]]
+        if positions:
+            # ambiguous last name ("james", "curry"), guessing here would silently answer for the wrong player
+            return None
+
+        matches = self.search(name, k=1)
+        if matches and matches[0][0] >= self.min_fuzzy_score:
+            return matches[0][1]
+
+        return None
+
+# built once when the module is first imported and shared by every request
+player_name_index = PlayerNameIndex()
@@ -0,0 +1,89 @@
+import os
+import json
+import numpy as np
+
+# box score stat --> weight used to score a player's game
+PERFORMANCE_WEIGHTS = {
+    'points' : 1.0,
+    'assists' : 0.75,
+    'reboundsTotal' : 0.75,
+    'plusMinusPoints' : 0.5,
+    'blocks' : 0.65,
+    'steals' : 0.65,
+    'turnovers' : -1.0,
+    'threePointersAttempted' : -0.60,
+    'threePointersMade' : 0.50,
+    'fieldGoalsAttempted' : -0.50,
+    'fieldGoalsMade' : 0.40,
+    'freeThrowsAttempted' : -0.20,
+    'freeThrowsMade' : 0.10
+}
+
+class PerformanceRanker:
+    def __init__(self, weights: dict = None, k: int = None):
+        if weights is None:
+            # PERFORMANCE_WEIGHTS can override individual weights, e.g. '{"plusMinusPoints": 0.25}'
+            weights = {**PERFORMANCE_WEIGHTS, **json.loads(os.getenv('PERFORMANCE_WEIGHTS', '{}'))}
+        if k is None:
+            k = int(os.getenv('RANKING_TOP_K', 2))
+
+        self.weights = weights
+        self.stats = list(weights.keys())
+        self.weight_vector = np.array([weights[stat] for stat in self.stats], dtype=np.float64)
+        # number of players kept per team
+        self.k = k
+
+    def flatten(self, games: dict):
+        # one players x weighted stats matrix across every game / team. rows for a team are contiguous, and bounds marks where each team starts
+        blocks = []
+        owners = []
+        bounds = [0]
+        for id_key, game in games.items():
+            for side, team in game.teams().items():
+                blocks.append(team.players.columns(self.stats))
+                owners.append((id_key, side))
+                bounds.append(bounds[-1] + len(team.players))
+
+        matrix = np.vstack(blocks) if blocks else np.zeros((0, len(self.stats)))
+        return matrix, owners, bounds
+
+    def score(self, matrix):
+        # a single dot product scores every player at once
+        return matrix @ self.weight_vector
+
+    def top_k(self, scores, k: int):
+        # indices of the k highest scores, best first. argpartition avoids sorting everything
+        if k >= len(scores):
+            return np.argsort(-scores, kind="stable")
+        best = np.argpartition(-scores, k - 1)[:k]
+        return best[np.argsort(-scores[best], kind="stable")]
+
+    def rank_games(self, games: dict, k: int = None) -> dict:
+        # id_key --> {side --> rows of the top k players in that team's PlayerTable}, for any number of games (a night, a week, a season)
+        if k is None:
+            k = self.k
+
+        matrix, owners, bounds = self.flatten(games)
+        scores = self.score(matrix)
+
+        ranked = {id_key : {} for id_key in games}
+        for (id_key, side), start, end in zip(owners, bounds[:-1], bounds[1:]):
+            ranked[id_key][side] = [int(i) for i in self.top_k(scores[start:end], k)]
+        return ranked
+
+    def best_performances(self, games: dict, k: int = 10) -> list:
+        # the k best individual games across every box score passed in, as (score, id_key, side, personId)
+        matrix, owners, bounds = self.flatten(games)
+        if not len(matrix):
+            return []
+
+        scores = self.score(matrix)
+        starts = np.array(bounds[:-1])
+        best = []
+        for i in self.top_k(scores, k):
+            # map the flat row back to its team and the row inside that team's table
+            team = int(np.searchsorted(starts, i, side="right")) - 1
+            id_key, side = owners[team]
+            person_id = games[id_key].teams()[side].players.person_ids[i - starts[team]]
+            best.append((float(scores[i]), id_key, side, int(person_id)))
+        return best
@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import nba_api.stats.endpoints as nba_api
+from SeasonStatTable import SeasonStatTable
+from ClientRegistry import get_nba_session
+
+class PlayerStatsStore:
+    def __init__(self, ttl_seconds: float = None, max_entries: int = None):
+        # stats.nba.com data changes at most once a day, so default to holding entries for a few hours
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('PLAYER_STATS_TTL_SECONDS', 6 * 60 * 60))
+        if max_entries is None:
+            max_entries = int(os.getenv('PLAYER_STATS_MAX_ENTRIES', 1024))
+
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # maps (endpoint, player_id, season) --> (expiry timestamp, response frames). ordered from least to most recently used
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # one lock per key currently being fetched, so concurrent misses on the same key only hit the API once
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        # route nba_api requests through the shared keep-alive session
+        get_nba_session()
+
+    def get(self, endpoint: str, player_id: int, season: str, loader):
+        key = (endpoint, player_id, season)
+
+        value = self._lookup(key)
+        if value is not None:
+            return value
+
+        with self.lock:
+            key_lock = self.pending.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # another thread may have fetched this key while we were waiting on the lock
+            value = self._lookup(key, count=False)
+            if value is not None:
+                return value
+
+            try:
+                # no throttling here: nba_api calls are already rate limited by the nba gateway, and derived entries are computed locally
+                value = loader()
+                self._store(key, value)
+            finally:
+                with self.lock:
+                    self.pending.pop(key, None)
+
+        return value
+
+    def _lookup(self, key: tuple, count: bool = True):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+
+            expires_at, value = entry
+            # stale entries are dropped so the next caller refetches them
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                if count:
+                    self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return value
+
+    def _store(self, key: tuple, value) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self.entries.move_to_end(key)
+            # evict the least recently used entries once we are over capacity
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, player_id: int = None) -> None:
+        with self.lock:
+            if player_id is None:
+                self.entries.clear()
+                return
+
+            for key in [key for key in self.entries if key[1] == player_id]:
+                del self.entries[key]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries" : len(self.entries), "hits" : self.hits, "misses" : self.misses}
+
+    def get_career_stats(self, player_id: int):
+        # a single PlayerCareerStats response holds both the season profile (frame 0) and the career totals (frame 1)
+        return self.get("PlayerCareerStats", player_id, None, lambda: nba_api.PlayerCareerStats(player_id).get_data_frames())
+
+    def get_career_stats_profile(self, player_id: int):
+        return self.get_career_stats(player_id)[0]
+
+    def get_career_stats_totals(self, player_id: int):
+        return self.get_career_stats(player_id)[1]
+
+    def get_season_stat_table(self, player_id: int):
+        # fetch the profile first so the table is built from the cached response
+        profile = self.get_career_stats_profile(player_id)
+        return self.get("SeasonStatTable", player_id, None, lambda: SeasonStatTable(profile))
+
+    def get_common_player_info(self, player_id: int):
+        return self.get("CommonPlayerInfo", player_id, None, lambda: nba_api.CommonPlayerInfo(player_id).get_data_frames()[0])
+
+    def get_player_awards(self, player_id: int):
+        return self.get("PlayerAwards", player_id, None, lambda: nba_api.PlayerAwards(player_id).get_data_frames()[0])
+
+    def get_shot_dashboard(self, player_id: int, season: str):
+        return self.get("PlayerDashPtShots", player_id, season, lambda: nba_api.PlayerDashPtShots(player_id=player_id, season=season, team_id=0).get_data_frames()[0])
+
+    def get_shot_chart(self, player_id: int, season: str):
+        # context_measure_simple="FGA" paramater gives us all shot attempts (makes and misses)
+        return self.get("ShotChartDetail", player_id, season, lambda: nba_api.ShotChartDetail(player_id=player_id, season_nullable=season, team_id=0, context_measure_simple="FGA").get_data_frames()[0])
+
+# process-wide store shared by every PlayerTools instance
+player_stats_store = PlayerStatsStore()
@@ -1,33 +1,41 @@
-from nba_api.stats.static import players
-import nba_api.stats.endpoints as nba_api
+import numpy as np
+from PlayerNameIndex import PlayerNameIndex, player_name_index
+from PlayerStatsStore import PlayerStatsStore, player_stats_store
 
 class PlayerTools:
-    def __init__(self):
+    def __init__(self, store: PlayerStatsStore = None, name_index: PlayerNameIndex = None):
         self.base_url = "https://stats.nba.com/stats/"
+        # every endpoint response is served out of the shared stats store so each player is only fetched once
+        self.store = store if store is not None else player_stats_store
+        # in-memory name index, so lookups are a dictionary hit instead of a regex scan over every player
+        self.name_index = name_index if name_index is not None else player_name_index
 
     def get_player_id(self, player_name: str) -> int:
-        # assumes that there should be a single match to this name 
-        res = players.find_players_by_full_name(player_name)
+        # exact and alias matches first, falling back to the closest fuzzy match (handles typos and nicknames)
+        res = self.name_index.resolve(player_name)
         # if the query resulted in no matches, throw an error
-        if( not res ):
+        if( res is None ):
             raise ValueError("Player does not exist")
         
-        return res[0]['id']
+        return res['id']
     
     def get_common_player_info_item(self, player_id: int, item: str) -> str:
-        # make API request to resource
-        response = nba_api.CommonPlayerInfo(player_id)
-        # extract response as a dataframe 
-        df = response.get_data_frames()
+        # fetch the (cached) common player info frame
+        df = self.store.get_common_player_info(player_id)
 
-        return df[0][item].item()
+        return df[item].item()
+
+    def get_common_player_info_items(self, player_id: int, items: list) -> dict:
+        # pull several fields out of a single common player info response
+        df = self.store.get_common_player_info(player_id)
+        row = df.iloc[0]
+
+        return {item : row[item] for item in items}
     
     def get_player_awards(self, player_id: int) -> dict[str, int]:
-        # make API request to resource
-        response = nba_api.PlayerAwards(player_id)
-        # extract response as a dataframe
-        df = response.get_data_frames()
-        df = df[0]["DESCRIPTION"]
+        # fetch the (cached) awards frame
+        df = self.store.get_player_awards(player_id)
+        df = df["DESCRIPTION"]
         # build out awards dictionary 
         awards_count = {}
 
@@ -40,91 +48,70 @@ class PlayerTools:
         return awards_count
     
     def get_player_career_stats_profile(self, player_id: int):
-        # make API request to resource
-        response = nba_api.PlayerCareerStats(player_id)
-        # extract responses as a dataframe
-        df = response.get_data_frames()
-        return df[0]
+        # season by season profile, served from the single cached PlayerCareerStats response
+        return self.store.get_career_stats_profile(player_id)
     
     def get_player_career_stats_totals(self, player_id: int):
-        # make API request to resource
-        response = nba_api.PlayerCareerStats(player_id)
-        # extract responses as a dataframe
-        df = response.get_data_frames()
-        return df[1]
+        # career totals, served from the single cached PlayerCareerStats response
+        return self.store.get_career_stats_totals(player_id)
     
     def get_player_shot_chart_details_for_year(self, player_id: int, year: str) -> str:
-        # make API request to resource
-        response = nba_api.PlayerDashPtShots(player_id=player_id, season=year, team_id=0)
-        # extract responses as a datafrmae
-        df = response.get_data_frames()
-        return df[0]
+        return self.store.get_shot_dashboard(player_id, year)
     
     def get_player_heatmap_for_year(self, player_id: int, year: str) -> str:
-        # make API request to resource. Note: context_measure_simple="FGA" paramater gives us all shot attempts (makes and misses)
-        response = nba_api.ShotChartDetail(player_id=player_id, season_nullable=year, team_id=0, context_measure_simple="FGA")
-        # extract responses as a dataframe
-        df = response.get_data_frames()
-        return df[0]
+        return self.store.get_shot_chart(player_id, year)
+
+    def get_player_stat_for_year(self, player_id: int, year: str, stat: str, aggregation: str = "total"):
+        # every season level stat is answered from one precomputed (and cached) table per player
+        return self.store.get_season_stat_table(player_id).get(stat, year, aggregation)
 
     def get_player_fg_pct_for_year(self, player_id: int, year: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        fg_pct = df[df["SEASON_ID"] == year]["FG_PCT"].item()
+        fg_pct = self.get_player_stat_for_year(player_id, year, "FG_PCT")
         formatted_str = f'{player_name} shot [b]{fg_pct}[/b] from the field in the {year} season.'
         return {"raw_stat" : fg_pct, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_3pt_pct_for_year(self, player_id: int, year: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        three_pt_pct = df[df["SEASON_ID"] == year]["FG3_PCT"].item()
+        three_pt_pct = self.get_player_stat_for_year(player_id, year, "FG3_PCT")
         formatted_str = f'{player_name} shot [b]{three_pt_pct}[/b] from three in the {year} season.'
         return {"raw_stat" : three_pt_pct, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_ft_pct_for_year(self, player_id: int, year: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        ft_pct = df[df["SEASON_ID"] == year]["FT_PCT"].item()
+        ft_pct = self.get_player_stat_for_year(player_id, year, "FT_PCT")
         formatted_str = f'{player_name} shot [b]{ft_pct}[/b] from the free throw line in the {year} season.'
         return {"raw_stat" : ft_pct, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_rebounds_for_year(self, player_id: int, year: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        reb = df[df["SEASON_ID"] == year]["REB"].item()
+        reb = self.get_player_stat_for_year(player_id, year, "REB")
         formatted_str = f'{player_name} had [b]{reb}[/b] rebounds in the {year} season.'
         return {"raw_stat" : reb, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_assists_for_year(self, player_id: int, year: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        ast = df[df["SEASON_ID"] == year]["AST"].item()
+        ast = self.get_player_stat_for_year(player_id, year, "AST")
         formatted_str = f'{player_name} had [b]{ast}[/b] assists in the {year} season.'
         return {"raw_stat" : ast, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_steals_for_year(self, player_id: int, year: str, player_name: str) -> str: 
-        df = self.get_player_career_stats_profile(player_id)
-        stl = df[df["SEASON_ID"] == year]["STL"].item()
+        stl = self.get_player_stat_for_year(player_id, year, "STL")
         formatted_str = f'{player_name} had [b]{stl}[/b] steals in the {year} season.'
         return {"raw_stat" : stl, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_blocks_for_year(self, player_id: int, year: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        blk = df[df["SEASON_ID"] == year]["BLK"].item()
+        blk = self.get_player_stat_for_year(player_id, year, "BLK")
         formatted_str = f'{player_name} had [b]{blk}[/b] blocks in the {year} season.'
         return {"raw_stat" : blk, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_turnovers_for_year(self, player_id: int, year: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        tov = df[df["SEASON_ID"] == year]["TOV"].item()
+        tov = self.get_player_stat_for_year(player_id, year, "TOV")
         formatted_str = f'{player_name} had [b]{tov}[/b] turnovers in the {year} season.'
         return {"raw_stat" : tov, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_points_for_year(self, player_id: int, year: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        pts = df[df["SEASON_ID"] == year]["PTS"].item()
+        pts = self.get_player_stat_for_year(player_id, year, "PTS")
         formatted_str = f'{player_name} had [b]{pts}[/b] points in the {year} season.'
         return {"raw_stat" : pts, "stat_formatted" : formatted_str, "player_name" : player_name}
     
     def get_player_stat_average_per_game_for_year(self, player_id: int, year: str, stat: str, player_name: str) -> str:
-        df = self.get_player_career_stats_profile(player_id)
-        season_row = df[df["SEASON_ID"] == year]
-        stat_average_per_game = season_row[stat].item() / season_row["GP"].item() 
+        stat_average_per_game = self.get_player_stat_for_year(player_id, year, stat, "per_game")
         stat_average_per_game = round(stat_average_per_game, 1)
 
         stat_formatted = {'PTS' : 'points', 'REB' : 'rebounds', 'AST' : 'assists', 'STL' : 'steals', 'BLK' : 'blocks', 'TOV' : 'turnovers'}
@@ -174,17 +161,13 @@ class PlayerTools:
         3) show how it compares to similar players! (implement last)
         '''
         charts = []
-        # getting average numbers for each season
-        df = self.get_player_career_stats_profile(player_id)
-        season_averages = [0] * len(df)
-        for index, row in df.iterrows():
-            ppg = row["PTS"] / row["GP"]
-            ppg = round(ppg, 2)
-            season = str(row["SEASON_ID"])
-            color = 0
-            if( year == season ):
-                color = 1
-            season_averages[index] = {'name' : season, 'value' : ppg, 'color' : color}
+        # getting average numbers for each season, straight out of the precomputed season table
+        table = self.store.get_season_stat_table(player_id)
+        ppg_by_season = np.round(table.season_values("PTS", "per_game"), 2)
+        season_averages = [
+            {'name' : season, 'value' : float(ppg), 'color' : int(season == year)}
+            for season, ppg in zip(table.seasons, ppg_by_season)
+        ]
     
         charts.append({'chart_type' : 'bar', 'chart_data' : season_averages})
         # getting the players shot diet for the given year
@@ -0,0 +1,82 @@
+import os
+import threading
+import numpy as np
+from GameData import PLAYER_COLUMNS, format_number
+
+# player columns dropped first when a game is over its token budget, least useful to the summary first
+DROP_ORDER = [
+    "plusMinusPoints",
+    "freeThrowsAttempted",
+    "freeThrowsMade",
+    "threePointersAttempted",
+    "fieldGoalsAttempted",
+    "minutes",
+    "turnovers",
+    "steals",
+    "blocks"
+]
+
+class PromptCompactor:
+    def __init__(self, token_budget: int = None, encoding: str = None):
+        if token_budget is None:
+            token_budget = int(os.getenv('PROMPT_TOKEN_BUDGET', 250))
+        if encoding is None:
+            encoding = os.getenv('PROMPT_TOKEN_ENCODING', 'o200k_base')
+
+        self.token_budget = token_budget
+        self.encoding_name = encoding
+        self.encoding = None
+        self.encoding_lock = threading.Lock()
+
+    def count_tokens(self, text: str) -> int:
+        with self.encoding_lock:
+            if self.encoding is None:
+                try:
+                    import tiktoken
+                    self.encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    # tiktoken downloads its encodings on first use. without them, fall back to the usual ~4 characters per token
+                    print(f'Could not load {self.encoding_name} encoding, estimating tokens instead: {e}')
+                    self.encoding = False
+
+        if self.encoding is False:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text))
+
+    def team_line(self, side: str, team) -> str:
+        # shooting as made-attempted only, the percentages are derivable from them. zero counts are left out
+        s = team.stats
+        parts = [f'FG {s["field_goals_made"]}-{s["field_goals_attempted"]}', f'3P {s["three_pointers_made"]}-{s["three_pointers_attempted"]}', f'FT {s["free_throws_made"]}-{s["free_throws_attempted"]}']
+        parts += [f'{label} {s[field]}' for field, label in (("rebounds", "REB"), ("assists", "AST"), ("steals", "STL"), ("blocks", "BLK"), ("turnovers", "TOV")) if s[field]]
+        return f'{side} {team.team_name} {s["points"]}: {", ".join(parts)}'
+
+    def render(self, game, columns: list, rows_per_team: int) -> str:
+        index = {column : i for i, column in enumerate(PLAYER_COLUMNS)}
+        lines = [self.team_line("H", game.home), self.team_line("A", game.away)]
+        if columns and rows_per_team > 0:
+            lines.append(f'T|Player|{" ".join(PLAYER_COLUMNS[column] for column in columns)}')
+            for side, team in (("H", game.home), ("A", game.away)):
+                values = team.players.values[:rows_per_team][:, [index[column] for column in columns]]
+                for name, row in zip(team.players.names, values):
+                    lines.append(f'{side}|{name}|{" ".join(format_number(value) for value in row)}')
+        return "\n".join(lines)
+
+    def compact(self, game):
+        # returns (prompt, tokens). columns that are zero for every listed player are dropped up front, then
+        # columns in DROP_ORDER and finally the last player rows are dropped until the prompt fits the budget
+        players = np.vstack([game.home.players.values, game.away.players.values])
+        columns = [column for i, column in enumerate(PLAYER_COLUMNS) if players[:, i].any()]
+        rows_per_team = max(len(game.home.players), len(game.away.players))
+
+        prompt = self.render(game, columns, rows_per_team)
+        tokens = self.count_tokens(prompt)
+        drops = [column for column in DROP_ORDER if column in columns]
+        while tokens > self.token_budget and (drops or rows_per_team > 1):
+            if drops:
+                columns.remove(drops.pop(0))
+            else:
+                rows_per_team -= 1
+            prompt = self.render(game, columns, rows_per_team)
+            tokens = self.count_tokens(prompt)
+
+        return prompt, tokens
@@ -0,0 +1,177 @@
+import os
+import re
+import atexit
+import threading
+from collections import OrderedDict
+import numpy as np
+from EmbeddingService import embedding_service
+
+class QueryCache:
+    def __init__(self, max_entries: int = None, similarity_threshold: float = None, persist_path: str = None, semantic: bool = None):
+        if max_entries is None:
+            max_entries = int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 4096))
+        if similarity_threshold is None:
+            similarity_threshold = float(os.getenv('QUERY_CACHE_SIMILARITY', 0.92))
+        if persist_path is None:
+            persist_path = os.getenv('QUERY_CACHE_PATH')
+        if semantic is None:
+            semantic = os.getenv('QUERY_CACHE_SEMANTIC', '1') != '0'
+
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.persist_path = persist_path
+        self.semantic = semantic
+
+        # maps normalized query --> label, ordered from least to most recently used
+        self.entries = OrderedDict()
+        # maps normalized query --> unit length sentence embedding (only for queries we were able to embed)
+        self.embeddings = {}
+        # stacked embedding matrix used for nearest neighbor lookups, rebuilt lazily whenever the entries change
+        self.matrix = None
+        self.matrix_keys = []
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.unsaved_writes = 0
+
+        if self.persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    def normalize(self, q: str) -> str:
+        # lowercase, drop punctuation and collapse whitespace so trivially different phrasings share a key
+        q = re.sub(r"[^\w\s'-]", " ", q.lower())
+        return " ".join(q.split())
+
+    def embed(self, key: str):
+        if not self.semantic:
+            return None
+
+        # no embedding backend available, fall back to exact matching only
+        if not embedding_service.available():
+            self.semantic = False
+            return None
+
+        # queries are already persisted with their embeddings here, so skip the service's disk cache
+        return embedding_service.encode([key], normalize=True, use_cache=False)[0]
+
+    def lookup(self, q: str):
+        # returns (label, embedding). the embedding is handed back so a miss can be stored without encoding the query twice
+        key = self.normalize(q)
+
+        with self.lock:
+            # first tier: exact match on the normalized query
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.exact_hits += 1
+                return self.entries[key], None
+
+        embedding = self.embed(key)
+        if embedding is None:
+            with self.lock:
+                self.misses += 1
+            return None, None
+
+        with self.lock:
+            # second tier: nearest neighbour over the embeddings of previously classified queries
+            matrix = self._embedding_matrix()
+            if matrix is not None:
+                # embeddings are unit length, so the dot product is the cosine similarity
+                similarities = matrix @ embedding
+                best = int(np.argmax(similarities))
+                best_key = self.matrix_keys[best]
+                if similarities[best] >= self.similarity_threshold and best_key in self.entries:
+                    self.entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self.entries[best_key], embedding
+
+            self.misses += 1
+            return None, embedding
+
+    def put(self, q: str, label: str, embedding=None) -> None:
+        key = self.normalize(q)
+        if embedding is None and key not in self.embeddings:
+            embedding = self.embed(key)
+
+        with self.lock:
+            self.entries[key] = label
+            self.entries.move_to_end(key)
+            if embedding is not None:
+                self.embeddings[key] = embedding
+            # evict the least recently used queries once we are over capacity
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self.embeddings.pop(evicted, None)
+            self.matrix = None
+            self.unsaved_writes += 1
+            flush = self.persist_path and self.unsaved_writes >= 50
+
+        if flush:
+            self.save()
+
+    def _embedding_matrix(self):
+        # caller must hold the lock
+        if self.matrix is None and self.embeddings:
+            self.matrix_keys = list(self.embeddings.keys())
+            self.matrix = np.stack([self.embeddings[key] for key in self.matrix_keys])
+        return self.matrix
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            hit_rate = (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+            return {
+                "entries" : len(self.entries),
+                "exact_hits" : self.exact_hits,
+                "semantic_hits" : self.semantic_hits,
+                "misses" : self.misses,
+                "hit_rate" : round(hit_rate, 4)
+            }
+
+    def save(self) -> None:
+        if not self.persist_path:
+            return
+
+        with self.lock:
+            keys = list(self.entries.keys())
+            labels = [self.entries[key] for key in keys]
+            has_embedding = np.array([key in self.embeddings for key in keys], dtype=bool)
+            dim = next((len(vector) for vector in self.embeddings.values()), 0)
+            embeddings = np.zeros((len(keys), dim), dtype=np.float32)
+            for i, key in enumerate(keys):
+                if key in self.embeddings:
+                    embeddings[i] = self.embeddings[key]
+            self.unsaved_writes = 0
+
+        # write to a temporary file first so a crash mid-write never leaves a corrupt cache behind
+        with self.save_lock:
+            tmp_path = f'{self.persist_path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, keys=np.array(keys, dtype=str), labels=np.array(labels, dtype=str), embeddings=embeddings, has_embedding=has_embedding)
+            os.replace(tmp_path, self.persist_path)
+
+    def load(self) -> None:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+
+        try:
+            data = np.load(self.persist_path)
+            keys, labels, embeddings, has_embedding = data["keys"], data["labels"], data["embeddings"], data["has_embedding"]
+        except Exception as e:
+            # a broken cache file should never stop the API from starting
+            print(f'Could not load query cache from {self.persist_path}: {e}')
+            return
+
+        with self.lock:
+            for i in range(len(keys)):
+                key = str(keys[i])
+                self.entries[key] = str(labels[i])
+                if has_embedding[i]:
+                    self.embeddings[key] = embeddings[i]
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self.embeddings.pop(evicted, None)
+            self.matrix = None
@@ -1,14 +1,21 @@
 import requests
 import os
-from groq import Groq
-from sentence_transformers import SentenceTransformer
-from sklearn.cluster import DBSCAN
-from sklearn.preprocessing import StandardScaler
 import re
-from supabase import Client, create_client
+from ClientRegistry import get_groq, get_supabase
+from SupabaseAuth import get_auth_session
 from datetime import date
-
-client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+from SupabaseWriter import BulkWriter
+from DailyDigest import materialize_digest
+from EmbeddingService import embedding_service
+from Upstreams import GROQ_TRANSIENT_ERRORS, call_with_retries, groq_rate_limiter, upstream_slot
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from functools import partial
+import time
+import numpy as np
+from RedditState import RedditState, post_fingerprint, story_fingerprint
+from StoryClustering import get_clusterer
+
+client = get_groq()
 message_template_news = [
     {
         "role" : "system",
@@ -25,218 +32,312 @@ message_template_highlight = [
 
 model = "openai/gpt-oss-120b"
 
-supabase_url = os.environ.get("SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_KEY")
-supabase = create_client(supabase_url, supabase_key)
-
-def summarize_news_story(post: str) -> str:
-    # add the user query to the classifier message history
-    message_template_news.append({
-        "role" : "user",
-        "content" : post
-    })
-
-    # send a request to the model 
-    chat_completion = client.chat.completions.create(
-        messages = message_template_news,
-        model = model,
-        temperature = 0.5
-    )
-
-    # capture the classification
-    classification = chat_completion.choices[0].message.content
-
-    # pop the query from the message history
-    message_template_news.pop()
-
-    return classification
-
-def summarize_highlight(post: str) -> str:
-    # add the highlight name to the message history
-    message_template_highlight.append({
-        "role" : "user",
-        "content" : post
-    })
-
-    # send a request to the model
-    chat_completion = client.chat.completions.create(
-        messages = message_template_highlight,
-        model = model,
-        temperature = 0.5
-    )
-
-    highlight_name = chat_completion.choices[0].message.content
-    message_template_highlight.pop()
-    
-    return highlight_name
+supabase = get_supabase()
+
+# groups posts into stories. STORY_CLUSTERING picks the algorithm (dbscan, hdbscan or agglomerative)
+clusterer = get_clusterer()
+
+# incremental mode: pages of the listing to read, and how close a new post must be to join an existing story
+max_pages = int(os.getenv('REDDIT_MAX_PAGES', 4))
+attach_similarity = float(os.getenv('REDDIT_ATTACH_SIMILARITY', 0.6))
+
+# concurrency and wall time budget for the news / highlight rewriting calls
+rewrite_workers = int(os.getenv('REDDIT_REWRITE_WORKERS', 6))
+rewrite_deadline = float(os.getenv('REDDIT_REWRITE_DEADLINE_SECONDS', 120))
+# attempts per rewrite, as long as the deadline has not passed
+rewrite_attempts = int(os.getenv('REDDIT_REWRITE_ATTEMPTS', 3))
+
+def complete(messages: list, deadline: float = None) -> str:
+    def request():
+        # every rewrite shares the groq rate limit and concurrency cap with the rest of the process
+        groq_rate_limiter.acquire()
+        with upstream_slot("groq"):
+            groq_client = client
+            if deadline is not None:
+                # never let a single call run past the deadline for the whole batch. the client's own retries would each
+                # get a full timeout, so they are turned off and retried below with whatever time is left
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Rewrite deadline passed before the request was sent")
+                groq_client = client.with_options(timeout=remaining, max_retries=0)
+
+            # send a request to the model 
+            chat_completion = groq_client.chat.completions.create(
+                messages = messages,
+                model = model,
+                temperature = 0.5
+            )
+
+        return chat_completion.choices[0].message.content
+
+    if deadline is None:
+        return request()
+    return call_with_retries(request, attempts=rewrite_attempts, retryable=lambda e: isinstance(e, GROQ_TRANSIENT_ERRORS) and time.monotonic() < deadline)
+
+def summarize_news_story(post: str, deadline: float = None) -> str:
+    # build the messages per call, the shared template is never mutated so calls can run concurrently
+    return complete(message_template_news + [{"role" : "user", "content" : post}], deadline)
+
+def summarize_highlight(post: str, deadline: float = None) -> str:
+    return complete(message_template_highlight + [{"role" : "user", "content" : post}], deadline)
+
+def summarize_news_cluster(story_list: list, deadline: float = None) -> dict:
+    prompt = '{'
+    for h, story_text, media in story_list:
+        prompt += f'Headline: {h}. '
+        prompt += f'Story: {story_text}. '
+    prompt += '}'
+    summary = summarize_news_story(prompt, deadline)
+    # regex match any text after headline and after the text sections. Regex match shoudl stop at any delimetter (, . or newline)
+    pattern = r"Headline:\s*(.*?)[.,\s]*Story:\s*(.*)}"
+    match = re.search(pattern, summary)
+    if not match:
+        raise Exception(f"Bad Output: {summary}")
 
-def reddit_pipeline():
+    return {
+        "Headline" : match.group(1).strip(),
+        "Story" : match.group(2).strip()
+    }
+
+def run_rewrites(jobs: list, workers: int = None, deadline_seconds: float = None) -> list:
+    # run every job concurrently, each is called with the batch deadline. results come back in job order,
+    # with None for any job that failed or did not finish before the deadline
+    if workers is None:
+        workers = rewrite_workers
+    if deadline_seconds is None:
+        deadline_seconds = rewrite_deadline
+
+    results = [None] * len(jobs)
+    if not jobs:
+        return results
+
+    deadline = time.monotonic() + deadline_seconds
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {executor.submit(job, deadline) : i for i, job in enumerate(jobs)}
+    try:
+        for future in as_completed(futures, timeout=max(0, deadline - time.monotonic())):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # one bad story should not cost us the rest of the run
+                print(f'Rewrite {i} failed: {e}')
+    except FuturesTimeoutError:
+        unfinished = sum(1 for future in futures if not future.done())
+        print(f'{unfinished} rewrites missed the {deadline_seconds}s deadline')
+    finally:
+        # drop anything still queued instead of waiting on it
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+def parse_post(data: dict) -> dict:
+    headline = data['title']
+    text = data['selftext_html']
+    # case: we have large HTML box-scores embedded in the post --> remove this information 
+    if text and len(text) > 500:
+        text = None
+
+    media = None
+    if 'url_overridden_by_dest' in data:
+        media = data['url_overridden_by_dest']
+
+    return {
+        "id" : data.get('name'),
+        "headline" : headline,
+        "text" : text,
+        "media" : media,
+        "fingerprint" : post_fingerprint(headline, text)
+    }
+
+def fetch_posts(max_pages: int = 1) -> list:
     url = "https://www.reddit.com/r/nba/best/.json?t=day"
 
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
     }
 
-    response = requests.get(url, headers=headers)
+    # follow reddit's `after` cursor for up to max_pages pages of the listing
+    posts = {}
+    after = None
+    for page in range(max_pages):
+        response = requests.get(url, headers=headers, params={"after" : after} if after else None)
+        listing = response.json()['data']
+        for child in listing['children']:
+            post = parse_post(child['data'])
+            posts.setdefault(post["id"], post)
 
-    data = response.json()
-    data = data['data']['children']
+        after = listing.get('after')
+        if not after:
+            break
 
     # handle case where we get an empty json object
-    if not data:
+    if not posts:
         raise Exception("Data Request down at this time... please try again later")
 
-    batch_stories = []
-    post_headlines = []
-    post_text = []
-    post_media = []
-    i = 0
-    #NOTE: it may be more efficient / cleaner here to use an index based dictionary that maps to all relevant post info, rather than independent ararys 
-    for highlight in data:
-        headline = highlight['data']['title']
-        text = highlight['data']['selftext_html']
-        # case: we have large HTML box-scores embedded in the post --> remove this information 
-        if text and len(text) > 500:
-            text = None
-        
-        media = None
-        if 'url_overridden_by_dest' in highlight['data']:
-            media = highlight['data']['url_overridden_by_dest']
-
-        # store the post name & matching index in a batch array to be summarized by the LLM 
-        batch_stories.append(f"{{index = {i}, headline = {headline}}}")
-        i += 1
-        # in independent arrays, store the headline, text, and media 
-        post_headlines.append(headline)
-        post_text.append(text)
-        post_media.append(media)
-
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    embeddings = embedding_model.encode(post_headlines)
-
-    scaler = StandardScaler()
-    embeddings = scaler.fit_transform(embeddings)
-
-    # epsilon --> maximum distance between vectors in a neighborhood
-    epsilon = 0.70
-    # minimum number of vectors (posts) for a cluster to form 
-    min_neighbors = 3
-
-    # run DBSCAN clustering using cosine similarity
-    db = DBSCAN(
-        eps=epsilon, 
-        min_samples=min_neighbors, 
-        metric='cosine'
-    ).fit(embeddings)
-
-    # grab cluster assignments
-    labels = db.labels_
-
-    # find the number of clusters --> subtract 1 to account for "noise"
-    num_clusters = len(set(labels))
-    if -1 in labels:
-        num_clusters -= 1
-
-    # all noise stories are labeled -1. count the number of times this label appears
-    num_noise_stories = list(labels).count(-1)
-
-    # 5. Group headlines by their cluster ID
+    return list(posts.values())
+
+def cluster_labels(embeddings):
+    # grab cluster assignments. all noise stories are labeled -1
+    return clusterer.fit_predict(embeddings)
+
+def is_highlight(post: dict) -> bool:
+    # need to do regex matching to extract highlights
+    return re.search(r'highlight', post["headline"], re.IGNORECASE) is not None
+
+def rewrite_stories(stories: list, highlight_posts: list):
+    # stories is a list of (story id, [post]). queue up every llm call first, then run them together
+    news_jobs = [partial(summarize_news_cluster, [(post["headline"], post["text"], post["media"]) for post in posts]) for story_id, posts in stories]
+    highlight_jobs = [partial(summarize_highlight, f'{post["headline"]}, {post["text"]}') for post in highlight_posts]
+
+    results = run_rewrites(news_jobs + highlight_jobs)
+    news = {}
+    for (story_id, posts), story in zip(stories, results[:len(news_jobs)]):
+        if story is not None:
+            news[story_id] = {**story, "story_id" : story_id}
+    highlights = {}
+    for post, title in zip(highlight_posts, results[len(news_jobs):]):
+        if title is not None:
+            highlights[post["id"]] = (title, post["media"], post["id"])
+
+    return news, highlights
+
+def reddit_pipeline():
+    posts = fetch_posts()
+
+    # the model is loaded once per process, and posts encoded by earlier runs come from the on-disk cache
+    embeddings = embedding_service.encode([post["headline"] for post in posts], keys=[post["id"] for post in posts])
+    labels = cluster_labels(embeddings)
+
+    # group posts by their cluster ID, noise points are stored under the -1 key
     grouped_stories = {}
-    highlights = []
-    news = []
-
-    for headline, label, text, media in zip(post_headlines, labels, post_text, post_media):
-        # Store noise points under the -1 key, and clusters under their ID
-        if label not in grouped_stories:
-            grouped_stories[label] = []
-        grouped_stories[label].append((headline, text, media))
-
-    for cluster_id, story_list in grouped_stories.items():
-        # cluster representing noise (individual posts)
-        if cluster_id == -1:
-            # need to do regex matching to extract highlights
-            pattern = r'highlight'
-            for h, story_text, media in story_list:
-                match = re.search(pattern, h, re.IGNORECASE)
-                if match:
-                    highlight_title = summarize_highlight(f"{h}, {story_text}")
-                    highlights.append((highlight_title, media))
-        else:
-            prompt = '{'
-            for h, story_text, media in story_list:
-                prompt += f'Headline: {h}. '
-                prompt += f'Story: {story_text}. '
-            prompt += '}'
-            summary = summarize_news_story(prompt)
-            # regex match any text after headline and after the text sections. Regex match shoudl stop at any delimetter (, . or newline)
-            pattern = r"Headline:\s*(.*?)[.,\s]*Story:\s*(.*)}"
-            match = re.search(pattern, summary)
-            if match:
-                news.append({
-                    "Headline" : match.group(1).strip(),
-                    "Story" : match.group(2).strip()
-                })
-            else:
-                raise Exception(f"Bad Output: {summary}")
-            
+    for post, label in zip(posts, labels):
+        grouped_stories.setdefault(label, []).append(post)
+
+    stories = [(story_fingerprint([post["id"] for post in story_posts]), story_posts) for label, story_posts in grouped_stories.items() if label != -1]
+    highlight_posts = [post for post in grouped_stories.get(-1, []) if is_highlight(post)]
+    news, highlights = rewrite_stories(stories, highlight_posts)
+
     return {
-        'news' : news, 'highlights' : highlights
+        'news' : list(news.values()), 'highlights' : list(highlights.values())
     }
 
-def user_authentication_email(email: str, password: str):
-    response = supabase.auth.sign_in_with_password(
-        {
-            "email" : email,
-            "password" : password
-        }
-    )
+def incremental_reddit_pipeline(state: RedditState):
+    # only embed, cluster and summarize posts we have not processed yet (or that were edited since)
+    posts = [post for post in fetch_posts(max_pages=max_pages) if state.is_new(post)]
+    stories = set(state.stale_clusters())
+    highlight_posts = []
+
+    if posts:
+        embeddings = embedding_service.encode([post["headline"] for post in posts], keys=[post["id"] for post in posts], normalize=True)
+
+        # a post joins today's closest existing story when it is similar enough, and that story is summarized again
+        unassigned = []
+        for post, embedding in zip(posts, embeddings):
+            story_id = state.cluster_of(post["id"])
+            if story_id is None:
+                story_id = state.nearest_cluster(embedding, attach_similarity)
+            if story_id is not None:
+                state.add_to_cluster(story_id, post, embedding)
+                stories.add(story_id)
+            else:
+                unassigned.append((post, embedding))
+
+        # cluster the rest together with earlier posts that did not form a story yet, so a story can build up across runs
+        new_ids = {post["id"] for post, embedding in unassigned}
+        candidates = unassigned + [(entry["post"], np.asarray(entry["embedding"], dtype=np.float32)) for post_id, entry in state.noise.items() if post_id not in new_ids]
+        labels = cluster_labels(np.stack([embedding for post, embedding in candidates])) if candidates else []
+
+        grouped = {}
+        for (post, embedding), label in zip(candidates, labels):
+            grouped.setdefault(label, []).append((post, embedding))
+        for label, members in grouped.items():
+            if label != -1:
+                stories.add(state.new_cluster([post for post, embedding in members], np.stack([embedding for post, embedding in members])))
+
+        # only posts that are new this run are rewritten as highlights
+        for post, embedding in grouped.get(-1, []):
+            if post["id"] in new_ids:
+                state.add_noise(post, embedding)
+                if is_highlight(post):
+                    highlight_posts.append(post)
+
+    stories = sorted(stories)
+    news, highlights = rewrite_stories([(story_id, state.clusters[story_id]["posts"]) for story_id in stories], highlight_posts)
+
+    for story_id in stories:
+        state.set_stale(story_id, story_id not in news)
+    # a highlight that failed is picked up again next run
+    for post in posts:
+        if not is_highlight(post) or post["id"] in highlights or state.cluster_of(post["id"]) is not None:
+            state.mark_seen(post)
 
-    return response
+    return {
+        'news' : list(news.values()), 'highlights' : list(highlights.values())
+    }
 
-def write_summaries():
-    # HARDCODE AUTH IN FOR NOW
-    user = os.getenv('SUPABASE_ROOT_USER')
-    passw = os.getenv('SUPABASE_ROOT_PW')
+def write_summaries(incremental: bool = None):
+    if incremental is None:
+        incremental = os.getenv('REDDIT_INCREMENTAL', '0') == '1'
 
-    # try to authenticate
-    try:
-        auth = user_authentication_email(user, passw)
-    except Exception as e:
-        print(e)
+    # sign in once per process and reuse the cached session
+    get_auth_session().ensure()
 
     # grab todays date
     todays_date = date.today().isoformat()
 
     # grab the data
-    data = reddit_pipeline()
+    state = None
+    if incremental:
+        state = RedditState()
+        state.start_day(todays_date)
+        data = incremental_reddit_pipeline(state)
+    else:
+        data = reddit_pipeline()
     news = data['news']
     highlights = data['highlights']
 
+    # rows are buffered and written in batches once everything has been added.
+    # stories and highlights are upserted on their ids, so a rerun updates them instead of inserting duplicates
+    writer = BulkWriter(supabase)
+
     # write out news stories
     for news_story in news:
         # build a mapping to the database field names
         database_fields_map = {
             'date' : todays_date,
+            'story_id' : news_story['story_id'],
             'headline' : news_story['Headline'],
             'story' : news_story['Story']
         }
 
-        response = supabase.table("News").insert(database_fields_map).execute()
-        print(response)
+        writer.add("News", database_fields_map)
     
     # write out highlights
-    for highlight_title, highlight_media in highlights:
+    for highlight_title, highlight_media, post_id in highlights:
         # build a mapping to the database field names
         database_fields_map = {
             'date' : todays_date,
+            'post_id' : post_id,
             'title' : highlight_title,
             'media' : highlight_media
         }
 
-        response = supabase.table("Highlights").insert(database_fields_map).execute()
-        print(response)
+        writer.add("Highlights", database_fields_map)
+
+    writer.flush()
+
+    # only remember what we processed once it has been written
+    if state is not None and not writer.failed_rows:
+        state.save()
+
+    # rebuild the precomputed bundle served by /fetchsummaries
+    materialize_digest(todays_date)
+    writer.raise_for_failures()
 
-write_summaries()
+# only run the pipeline when executed directly, so the module can be imported (e.g. for benchmarking) without side effects
+if __name__ == "__main__":
+    write_summaries()
 
 #TODO
 '''
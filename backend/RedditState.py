@@ -0,0 +1,132 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import date, timedelta
+import numpy as np
+
+def post_fingerprint(headline: str, text: str) -> str:
+    # changes whenever the post is edited, so edited posts are picked up again
+    return hashlib.sha1(f'{headline}\n{text or ""}'.encode("utf-8")).hexdigest()
+
+def story_fingerprint(post_ids: list) -> str:
+    # stable id for a story, taken from the posts that first formed it
+    return hashlib.sha1(",".join(sorted(post_ids)).encode("utf-8")).hexdigest()[:16]
+
+class RedditState:
+    def __init__(self, path: str = None, retention_days: int = None):
+        if path is None:
+            path = os.getenv('REDDIT_STATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'reddit_state.json'))
+        if retention_days is None:
+            retention_days = int(os.getenv('REDDIT_STATE_RETENTION_DAYS', 3))
+
+        self.path = path
+        # the t=day listing overlaps the previous day, so remember post ids for a few days
+        self.retention_days = retention_days
+        self.date = None
+        # post id --> {"fingerprint", "seen_on"}
+        self.seen_posts = {}
+        # story id --> {"posts" : [post], "mean" : [float], "stale" : bool}. only holds today's stories
+        self.clusters = {}
+        # post id --> {"post", "embedding"} for today's posts that did not join a story yet
+        self.noise = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except Exception as e:
+            # a broken state file only costs us one full run
+            print(f'Could not load reddit state from {self.path}: {e}')
+            return
+
+        self.date = data.get("date")
+        self.seen_posts = data.get("seen_posts", {})
+        self.clusters = data.get("clusters", {})
+        self.noise = data.get("noise", {})
+
+    def save(self) -> None:
+        with self.lock:
+            data = {"date" : self.date, "seen_posts" : self.seen_posts, "clusters" : self.clusters, "noise" : self.noise}
+
+        # write to a temporary file first so a crash mid-write never leaves a corrupt state behind
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def start_day(self, today: str) -> None:
+        # stories are written per date, so a new day starts with no stories to attach to
+        with self.lock:
+            if self.date != today:
+                self.date = today
+                self.clusters = {}
+                self.noise = {}
+
+            cutoff = (date.fromisoformat(today) - timedelta(days=self.retention_days)).isoformat()
+            self.seen_posts = {post_id : seen for post_id, seen in self.seen_posts.items() if seen["seen_on"] >= cutoff}
+
+    def is_new(self, post: dict) -> bool:
+        # new posts, and posts whose text changed since we last processed them
+        seen = self.seen_posts.get(post["id"])
+        return seen is None or seen["fingerprint"] != post["fingerprint"]
+
+    def mark_seen(self, post: dict) -> None:
+        with self.lock:
+            self.seen_posts[post["id"]] = {"fingerprint" : post["fingerprint"], "seen_on" : self.date}
+
+    def cluster_of(self, post_id: str):
+        for story_id, cluster in self.clusters.items():
+            if any(member["id"] == post_id for member in cluster["posts"]):
+                return story_id
+        return None
+
+    def nearest_cluster(self, embedding, min_similarity: float):
+        # embeddings are unit length, so the dot product with a normalized centroid is the cosine similarity
+        best_id, best_similarity = None, min_similarity
+        for story_id, cluster in self.clusters.items():
+            centroid = np.asarray(cluster["mean"], dtype=np.float32)
+            norm = np.linalg.norm(centroid)
+            if norm == 0:
+                continue
+            similarity = float(centroid @ embedding / norm)
+            if similarity >= best_similarity:
+                best_id, best_similarity = story_id, similarity
+        return best_id
+
+    def add_to_cluster(self, story_id: str, post: dict, embedding) -> None:
+        with self.lock:
+            cluster = self.clusters[story_id]
+            members = [member for member in cluster["posts"] if member["id"] != post["id"]]
+            if len(members) == len(cluster["posts"]):
+                # running mean of the member embeddings
+                size = len(members)
+                cluster["mean"] = ((np.asarray(cluster["mean"]) * size + embedding) / (size + 1)).tolist()
+            cluster["posts"] = members + [post]
+            self.noise.pop(post["id"], None)
+
+    def new_cluster(self, posts: list, embeddings) -> str:
+        story_id = story_fingerprint([post["id"] for post in posts])
+        with self.lock:
+            self.clusters[story_id] = {"posts" : list(posts), "mean" : np.mean(embeddings, axis=0).tolist(), "stale" : False}
+            for post in posts:
+                self.noise.pop(post["id"], None)
+        return story_id
+
+    def add_noise(self, post: dict, embedding) -> None:
+        with self.lock:
+            self.noise[post["id"]] = {"post" : post, "embedding" : np.asarray(embedding).tolist()}
+
+    def set_stale(self, story_id: str, stale: bool) -> None:
+        # a story whose summary failed is retried on the next run
+        with self.lock:
+            self.clusters[story_id]["stale"] = stale
+
+    def stale_clusters(self) -> list:
+        return [story_id for story_id, cluster in self.clusters.items() if cluster.get("stale")]
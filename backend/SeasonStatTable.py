@@ -0,0 +1,69 @@
+import numpy as np
+
+# counting stats reported per season by PlayerCareerStats (SeasonTotalsRegularSeason)
+COUNTING_STATS = ["GP", "GS", "MIN", "FGM", "FGA", "FG3M", "FG3A", "FTM", "FTA", "OREB", "DREB", "REB", "AST", "STL", "BLK", "TOV", "PF", "PTS"]
+# percentage stat --> (made, attempted)
+PERCENTAGE_STATS = {"FG_PCT" : ("FGM", "FGA"), "FG3_PCT" : ("FG3M", "FG3A"), "FT_PCT" : ("FTM", "FTA")}
+
+AGGREGATIONS = {"total", "per_game", "pct"}
+
+class SeasonStatTable:
+    def __init__(self, career_df):
+        # a traded player has one row per team plus a "TOT" row for the same season. keep only the TOT row for those seasons
+        df = career_df
+        if "TEAM_ABBREVIATION" in df.columns:
+            is_total = df["TEAM_ABBREVIATION"] == "TOT"
+            traded = df["SEASON_ID"].isin(df.loc[is_total, "SEASON_ID"])
+            df = df[~traded | is_total]
+        df = df.drop_duplicates(subset="SEASON_ID", keep="last")
+
+        self.seasons = [str(season) for season in df["SEASON_ID"]]
+        self.season_index = {season : i for i, season in enumerate(self.seasons)}
+
+        self.stats = [stat for stat in COUNTING_STATS if stat in df.columns]
+        self.stat_index = {stat : i for i, stat in enumerate(self.stats)}
+
+        # seasons x stats, computed for every season in one pass
+        self.totals = df[self.stats].to_numpy(dtype=np.float64)
+        games_played = self.totals[:, self.stat_index["GP"]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.per_game = np.where(games_played[:, None] > 0, self.totals / games_played[:, None], np.nan)
+
+            self.percentages = {}
+            for stat, (made, attempted) in PERCENTAGE_STATS.items():
+                if made not in self.stat_index or attempted not in self.stat_index:
+                    continue
+                made_values = self.totals[:, self.stat_index[made]]
+                attempted_values = self.totals[:, self.stat_index[attempted]]
+                # match the API, which reports 0 (rounded to 3 places) when there were no attempts
+                self.percentages[stat] = np.round(np.where(attempted_values > 0, made_values / attempted_values, 0.0), 3)
+
+    def season_values(self, stat: str, aggregation: str = "total"):
+        # every season's value for a stat, ordered like self.seasons
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation: {aggregation}")
+
+        if stat in self.percentages:
+            return self.percentages[stat]
+        if stat not in self.stat_index:
+            raise ValueError(f"Unknown stat: {stat}")
+        if aggregation == "per_game":
+            return self.per_game[:, self.stat_index[stat]]
+        if aggregation == "pct":
+            raise ValueError(f"{stat} is not a percentage stat")
+
+        return self.totals[:, self.stat_index[stat]]
+
+    def get(self, stat: str, season: str, aggregation: str = "total"):
+        if season not in self.season_index:
+            raise ValueError(f"No {season} season found for this player")
+
+        value = self.season_values(stat, aggregation)[self.season_index[season]]
+        # hand back plain python numbers, keeping counting totals as ints
+        if aggregation == "total" and stat not in self.percentages and float(value).is_integer():
+            return int(value)
+        return float(value)
+
+    def get_many(self, stats: list, seasons: list, aggregation: str = "total") -> dict:
+        # season --> {stat --> value}
+        return {season : {stat : self.get(stat, season, aggregation) for stat in stats} for season in seasons}
@@ -1,9 +1,11 @@
 from NewsletterTools import NewsletterTools
+from DailyDigest import materialize_digest
 
-# update standings
+# update standings and team snapshots from a single league standings call
 pipeline = NewsletterTools()
 pipeline.get_standings()
-pipeline.write_standings()
-
-# update team snapshots
-pipeline.write_team_snapshots()
\ No newline at end of file
+pipeline.write_standings_and_snapshots()
+# standings deltas are part of the bundle served by /fetchsummaries, so rebuild it
+materialize_digest(pipeline.date)
+# exit non-zero if any rows were dropped, so the scheduled run shows up as failed
+pipeline.writer.raise_for_failures()
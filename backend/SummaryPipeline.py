@@ -1,8 +1,22 @@
 from NewsletterTools import NewsletterTools
+from DailyDigest import materialize_digest
 
 summary_generator = NewsletterTools()
 summary_generator.get_previous_day_games()
 summary_generator.get_game_details()
 summary_generator.rank_players_for_game()
-summary_generator.generate_game_summary()
-summary_generator.write_summaries()
\ No newline at end of file
+# summaries are generated concurrently and written out as each game finishes
+summary_generator.summarize_and_write()
+# rebuild the precomputed bundle served by /fetchsummaries
+materialize_digest(summary_generator.date)
+
+# run report: how long each box score took to fetch, and which games failed
+for game_id, report in summary_generator.fetch_report.items():
+    print(f'{game_id}: {report}')
+for game_id, tokens in summary_generator.prompt_tokens.items():
+    print(f'{game_id}: prompt tokens {tokens["tokens"]} (uncompacted {tokens["full_tokens"]})')
+for game_id, error in summary_generator.summary_errors.items():
+    print(f'{game_id}: summary failed: {error}')
+
+# exit non-zero if any rows were dropped, so the scheduled run shows up as failed
+summary_generator.writer.raise_for_failures()
@@ -0,0 +1,72 @@
+import os
+import time
+import threading
+from ClientRegistry import get_or_create, get_supabase
+from Upstreams import upstream_slot
+
+class SupabaseAuthSession:
+    def __init__(self, supabase=None, email: str = None, password: str = None, refresh_margin: float = None):
+        # HARDCODE AUTH IN FOR NOW
+        self.email = email if email is not None else os.getenv('SUPABASE_ROOT_USER')
+        self.password = password if password is not None else os.getenv('SUPABASE_ROOT_PW')
+        if refresh_margin is None:
+            refresh_margin = float(os.getenv('SUPABASE_REFRESH_MARGIN_SECONDS', 300))
+
+        self.supabase = supabase if supabase is not None else get_supabase()
+        # refresh this many seconds before the JWT actually expires
+        self.refresh_margin = refresh_margin
+        self.session = None
+        self.lock = threading.Lock()
+        self.sign_ins = 0
+        self.refreshes = 0
+
+    def expires_soon(self) -> bool:
+        expires_at = getattr(self.session, "expires_at", None)
+        if expires_at is None:
+            return True
+        return expires_at - time.time() <= self.refresh_margin
+
+    def ensure(self):
+        # sign in once, then keep reusing the cached session until it is close to expiring
+        with self.lock:
+            if self.session is not None and not self.expires_soon():
+                return self.session
+
+            try:
+                with upstream_slot("supabase"):
+                    if self.session is not None:
+                        try:
+                            # refresh from the session the client holds rather than our copy, so we always use the latest refresh token
+                            response = self.supabase.auth.refresh_session()
+                            self.refreshes += 1
+                        except Exception as e:
+                            # the refresh token may have been revoked, fall back to a full sign in
+                            print(f'Could not refresh Supabase session, signing in again: {e}')
+                            response = self.sign_in()
+                    else:
+                        response = self.sign_in()
+            except Exception as e:
+                # match the old behaviour of carrying on unauthenticated when the sign in fails
+                print(e)
+                self.session = None
+                return None
+
+            self.session = response.session
+            return self.session
+
+    def sign_in(self):
+        self.sign_ins += 1
+        return self.supabase.auth.sign_in_with_password(
+            {
+                "email" : self.email,
+                "password" : self.password
+            }
+        )
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.session = None
+
+def get_auth_session() -> SupabaseAuthSession:
+    # one authenticated session per process, shared by the reader and the pipeline writers
+    return get_or_create("supabase_auth", SupabaseAuthSession)
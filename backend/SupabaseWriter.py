@@ -0,0 +1,105 @@
+import os
+import threading
+import httpx
+from postgrest.exceptions import APIError
+from Upstreams import call_with_retries, upstream_slot
+
+# table --> columns that uniquely identify a row. rows for these tables are upserted so reruns update instead of duplicating
+CONFLICT_KEYS = {
+    "Summaries" : "game_id",
+    "Team Snapshots" : "team_id,date",
+    "Standings" : "date",
+    "Daily Digests" : "date",
+    "News" : "story_id",
+    "Highlights" : "post_id"
+}
+
+# postgres error classes / http statuses worth retrying: connection problems, serialization failures, deadlocks, gateway errors
+TRANSIENT_ERROR_CODES = ("08", "40001", "40P01", "53", "57P", "429", "500", "502", "503", "504")
+
+def is_transient_error(e: Exception) -> bool:
+    if isinstance(e, httpx.TransportError):
+        return True
+    if isinstance(e, APIError) and e.code:
+        return str(e.code).startswith(TRANSIENT_ERROR_CODES)
+    return False
+
+class FailedWritesError(Exception):
+    def __init__(self, failed_rows: dict):
+        super().__init__("Failed to write " + ", ".join(f'{len(rows)} rows to {table}' for table, rows in failed_rows.items()))
+        self.failed_rows = failed_rows
+
+class BulkWriter:
+    def __init__(self, supabase, batch_size: int = None, attempts: int = 3, conflict_keys: dict = None):
+        if batch_size is None:
+            batch_size = int(os.getenv('SUPABASE_BATCH_SIZE', 100))
+
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.attempts = attempts
+        self.conflict_keys = conflict_keys if conflict_keys is not None else CONFLICT_KEYS
+        # table --> rows waiting to be written
+        self.buffers = {}
+        # table --> rows we gave up on after retrying
+        self.failed_rows = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def add(self, table: str, row: dict) -> None:
+        with self.lock:
+            self.buffers.setdefault(table, []).append(row)
+            full = len(self.buffers[table]) >= self.batch_size
+
+        if full:
+            self.flush(table)
+
+    def flush(self, table: str = None) -> None:
+        tables = [table] if table is not None else list(self.buffers.keys())
+        for name in tables:
+            with self.lock:
+                rows = self.buffers.pop(name, [])
+
+            for start in range(0, len(rows), self.batch_size):
+                self.write_batch(name, rows[start:start + self.batch_size])
+
+    def write_batch(self, table: str, rows: list) -> None:
+        if not rows:
+            return
+
+        conflict_key = self.conflict_keys.get(table)
+        if conflict_key:
+            # postgres rejects an upsert that touches the same row twice, so keep only the latest row per key
+            columns = conflict_key.split(",")
+            latest = {tuple(row.get(column) for column in columns) : row for row in rows}
+            rows = list(latest.values())
+
+        def request():
+            with upstream_slot("supabase"):
+                if conflict_key:
+                    return self.supabase.table(table).upsert(rows, on_conflict=conflict_key).execute()
+                return self.supabase.table(table).insert(rows).execute()
+
+        try:
+            call_with_retries(request, attempts=self.attempts, retryable=is_transient_error)
+        except Exception as e:
+            print(f'Failed to write {len(rows)} rows to {table}: {e}')
+            if isinstance(e, APIError) and e.code == "42P10":
+                # upserts need a unique constraint on the conflict columns, see schema.sql
+                print(f'{table} has no unique constraint on ({conflict_key})')
+            with self.lock:
+                self.failed_rows.setdefault(table, []).extend(rows)
+            return
+
+        print(f'Wrote {len(rows)} rows to {table}')
+
+    def raise_for_failures(self) -> None:
+        # batch jobs call this last, so rows dropped after retrying fail the run instead of exiting cleanly
+        with self.lock:
+            failed_rows = {table : rows for table, rows in self.failed_rows.items() if rows}
+        if failed_rows:
+            raise FailedWritesError(failed_rows)
@@ -1,18 +1,19 @@
 from PlayerTools import PlayerTools
-import os
-from groq import Groq
+from ClientRegistry import get_groq
 import json 
+from Upstreams import upstream_slot
+from Classifier import QUERY_TYPES
 
 class ToolInterface:
     def __init__(self):
 
-        self.client = Groq(api_key=os.getenv('GROQ_API_KEY'))
-        self.message_template = [
-            {
-                "role" : "system",
-                "content" : "Your job is to match the given user query to the tool that best accomplishes what the user is searching for"
-            }
-        ]
+        # shared, pooled Groq client
+        self.client = get_groq()
+        # prebuilt once and never mutated, so concurrent requests can share it safely
+        self.system_message = {
+            "role" : "system",
+            "content" : "Your job is to match the given user query to the tool that best accomplishes what the user is searching for"
+        }
         self.model = "openai/gpt-oss-20b"
 
         #TODO: can we automate the accumulation of these functions / descriptions? making it all dynamic would be a lot easier
@@ -200,29 +201,50 @@ class ToolInterface:
             "get_player_stat_average_per_game_for_year" : self.player_toolkit.get_player_stat_average_per_game_for_year
         }
 
-    def select_player_tool(self, q: str):
-        # add the user query to the classifier message history
-        self.message_template.append({
+        # combined mode: one model call both classifies the query and picks the player tool. non-player queries are reported through this extra tool
+        self.combined_system_message = {
             "role" : "system",
-            "content" : q
-        })
+            "content" : "You are classifying user prompts in an application that turns natural language queries into data. There are 6 possible query groupings: Player, Team, PlayerComparison, TeamComparison, PlayerFetch, TeamFetch. Player is when the user is searching something related to a single player, Team is when the user is searching something related to a single team, PlayerComparison is when the user is searching something related to 2 or more players, TeamComparison is when the user is searching something related to 2 or more teams. PlayerFetch is when the user is searching for players that fit some specific criteria. TeamFetch is when the user is searching for teams that fit some specific criteria. If the query is a Player query, call the player tool that best accomplishes what the user is searching for. Otherwise, call report_query_type with the group of the query."
+        }
+        self.combined_tools = self.tools + [
+            {
+                "type" : "function",
+                "function" : {
+                    "name" : "report_query_type",
+                    "description" : "reports the group of a query that is not about a single player",
+                    "parameters" : {
+                        "type" : "object",
+                        "properties" : {
+                            # Player is left out: a player query has to call a player tool, otherwise it would come back without an answer
+                            "query_type" : {"type" : "string", "enum" : sorted(QUERY_TYPES - {"Player"}), "description" : "the group of the query"}
+                        },
+                        "required" : ["query_type"]
+                    }
+                }
+            }
+        ]
+
+    def select_player_tool(self, q: str):
+        # build the messages for this call only, leaving the shared system message untouched
+        messages = [self.system_message, {"role" : "system", "content" : q}]
 
         # send a request to the model 
-        chat_completion = self.client.chat.completions.create(
-            messages = self.message_template,
-            model = self.model,
-            tools = self.tools,
-            tool_choice = "auto"
-        )
+        with upstream_slot("groq"):
+            chat_completion = self.client.chat.completions.create(
+                messages = messages,
+                model = self.model,
+                tools = self.tools,
+                tool_choice = "auto"
+            )
 
         # capture the correct tool to use
         tool = chat_completion.choices[0].message
-        
-        # pop the query from the message history
-        self.message_template.pop()
 
-        tool_name = tool.tool_calls[0].function.name
-        tool_args = tool.tool_calls[0].function.arguments
+        return self.resolve_tool_call(tool.tool_calls[0])
+
+    def resolve_tool_call(self, tool_call):
+        tool_name = tool_call.function.name
+        tool_args = tool_call.function.arguments
         
         # we want to replace the player name arg with player id
         tool_args = json.loads(tool_args)
@@ -235,6 +257,39 @@ class ToolInterface:
     def run_tool(self, q: str):
         tool_call_info = self.select_player_tool(q)
 
+        return self.execute_tool(tool_call_info)
+
+    def classify_and_select(self, q: str):
+        messages = [self.combined_system_message, {"role" : "user", "content" : q}]
+
+        # a single request both classifies the query and selects the tool
+        with upstream_slot("groq"):
+            chat_completion = self.client.chat.completions.create(
+                messages = messages,
+                model = self.model,
+                tools = self.combined_tools,
+                tool_choice = "required"
+            )
+
+        tool_calls = chat_completion.choices[0].message.tool_calls
+        if( not tool_calls ):
+            return {"query_type" : None, "tool_call" : None}
+
+        # non-player queries short-circuit without resolving any player
+        if( tool_calls[0].function.name == "report_query_type" ):
+            query_type = json.loads(tool_calls[0].function.arguments).get("query_type")
+            return {"query_type" : query_type, "tool_call" : None}
+
+        return {"query_type" : "Player", "tool_call" : self.resolve_tool_call(tool_calls[0])}
+
+    def classify_and_run(self, q: str):
+        selection = self.classify_and_select(q)
+        if( selection["tool_call"] is None ):
+            return {"query_type" : selection["query_type"], "answer" : None}
+
+        return {"query_type" : "Player", "answer" : self.execute_tool(selection["tool_call"])}
+
+    def execute_tool(self, tool_call_info: dict):
         func_name = tool_call_info["tool_name"]
         func_args = tool_call_info["tool_args"]
         player_image = tool_call_info["player_image"]
@@ -1,4 +1,5 @@
 from nba_api.stats.endpoints import leaguedashplayerstats
+from ClientRegistry import get_nba_session
 import matplotlib.pyplot as plt
 import pandas as pd
 import requests
@@ -24,6 +25,8 @@ plt.rcParams.update({
 # ---------------------------------------------------------
 # 2.  DATA: 2025-26 season
 # ---------------------------------------------------------
+# route requests through the shared session and its response store
+get_nba_session()
 stats = leaguedashplayerstats.LeagueDashPlayerStats(season="2025-26")
 df_25_26 = stats.get_data_frames()[0]
 df_25_26["PPG"] = df_25_26["PTS"] / df_25_26["GP"]
@@ -0,0 +1,85 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import groq
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# maximum number of in-flight requests we allow against each upstream service, shared by every thread in the process
+UPSTREAM_LIMITS = {
+    "nba" : int(os.getenv('NBA_MAX_CONCURRENCY', 4)),
+    "groq" : int(os.getenv('GROQ_MAX_CONCURRENCY', 8)),
+    "supabase" : int(os.getenv('SUPABASE_MAX_CONCURRENCY', 8))
+}
+
+upstream_slots = {name : threading.BoundedSemaphore(limit) for name, limit in UPSTREAM_LIMITS.items()}
+
+# bounded pool that runs the blocking upstream work for the async API handlers
+executor = ThreadPoolExecutor(max_workers=int(os.getenv('API_MAX_WORKERS', 32)), thread_name_prefix="upstream")
+
+def upstream_slot(name: str) -> threading.BoundedSemaphore:
+    # use as a context manager around a blocking upstream call: `with upstream_slot("nba"): ...`
+    if( name not in upstream_slots ):
+        raise ValueError(f"Unknown upstream: {name}")
+
+    return upstream_slots[name]
+
+async def run_blocking(func, *args, **kwargs):
+    # run a blocking call on the shared executor without tying up the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+class RateLimiter:
+    # token bucket shared across threads: allows short bursts up to `burst` requests, then `rate` requests per second
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        # the configured rate. slow_down / speed_up move self.rate between a floor and this ceiling
+        self.base_rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self, factor: float = 0.5, floor: float = 0.1) -> None:
+        # the upstream pushed back (429 / timeout): cut the rate for everyone sharing this limiter
+        with self.lock:
+            self.rate = max(floor, self.rate * factor)
+            self.tokens = min(self.tokens, 0.0)
+
+    def speed_up(self, step: float = 0.1) -> None:
+        # recover gradually towards the configured rate after successful requests
+        with self.lock:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * step)
+
+nba_rate_limiter = RateLimiter(rate=float(os.getenv('NBA_REQUESTS_PER_SECOND', 2)), burst=int(os.getenv('NBA_REQUEST_BURST', 4)))
+groq_rate_limiter = RateLimiter(rate=float(os.getenv('GROQ_REQUESTS_PER_SECOND', 4)), burst=int(os.getenv('GROQ_REQUEST_BURST', 8)))
+
+# groq errors worth another attempt (APITimeoutError is a connection error). auth and bad request errors are not
+GROQ_TRANSIENT_ERRORS = (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError)
+
+def call_with_retries(func, attempts: int = 3, base_delay: float = 1.0, max_delay: float = 10.0, on_retry=None, retryable=None):
+    # retry a failing call with exponential backoff and full jitter, re-raising the last error once we run out of attempts.
+    # retryable(error) can be passed to only retry errors that are worth retrying
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == attempts or (retryable is not None and not retryable(e)):
+                raise
+            if on_retry is not None:
+                on_retry(attempt, e)
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1))))
@@ -1,11 +1,19 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Header, Request, Response, status
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from Classifier import Classifier
+from Classifier import Classifier, QUERY_TYPES
 from PlayerCard import PlayerCard
 from ToolInterface import ToolInterface
 from datetime import date
+from Upstreams import run_blocking
+from DailyDigest import digest_cache
+from EmbeddingService import embedding_service
+from ClientRegistry import get_nba_gateway, get_nba_store
+from NbaGateway import CircuitOpenError
 from Newsletter import Newsletter
+import os
+import hmac
 
 app = FastAPI()
 classifier = Classifier()
@@ -19,27 +27,38 @@ origins = [
 
 app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
+@app.exception_handler(CircuitOpenError)
+async def nba_unavailable(request: Request, e: CircuitOpenError):
+    # stats.nba.com is down or throttling us: fail fast and tell the client when to come back
+    return JSONResponse(status_code=503, content={"detail" : "NBA stats are temporarily unavailable. Please try again later"}, headers={"Retry-After" : str(int(e.retry_after) + 1)})
+
+@app.on_event("startup")
+async def preload_embeddings():
+    # load the query cache's embedding model before the first request instead of during it
+    if( os.getenv('EMBEDDING_PRELOAD', '1') != '0' ):
+        await run_blocking(embedding_service.preload)
+
 class QueryBody(BaseModel):
     q: str
  
  # TODO: add a NameParser object here to extract the names relevant to the request --> add to the return object 
 @app.post("/query")
-def query(user_query: QueryBody):
-    query_type = classifier.classify_query(user_query.q)
+async def query(user_query: QueryBody):
+    query_type = await run_blocking(classifier.classify_query, user_query.q)
      # TODO: add some kind of logging mechanism here so that we can easily investigate why querires are failing 
-    if( query_type not in {"Player", "Team", "PlayerComparison", "TeamComparison", "PlayerFetch", "TeamFetch"} ):
+    if( query_type not in QUERY_TYPES ):
         raise HTTPException(status_code=422, detail="Server classification failure. Please try again later")
     
     return {"query_type" : query_type}
 
 
 @app.get("/playercard")
-def playercard(player_name: str):
+async def playercard(player_name: str):
     # check that player name is non-empty 
     if( not player_name ):
         raise HTTPException(status_code=400, detail="Empty request")
 
-    player_card = PlayerCard(player_name)
+    player_card = await run_blocking(PlayerCard, player_name)
     return player_card.build_player_card()
 
 class ToolBody(BaseModel):
@@ -47,9 +66,9 @@ class ToolBody(BaseModel):
     q_type: str
 
 @app.post("/usetool")
-def usetool(user_query: ToolBody):
+async def usetool(user_query: ToolBody):
     if( user_query.q_type == "Player" ):
-        answer = tools.run_tool(user_query.q)
+        answer = await run_blocking(tools.run_tool, user_query.q)
     else:
         answer = {"raw_stat" : 0, "stat_formatted" : "Null"}
     
@@ -57,11 +76,60 @@ def usetool(user_query: ToolBody):
 
 
 @app.get("/fetchsummaries")
-def fetchsummaries(games_date: str):
-    summary_generator = Newsletter()
-    # handle the collection of summaries, news articles, highlights, and standings updates
-    summaries = summary_generator.fetch_summaries(games_date)
-    news = summary_generator.fetch_news(games_date)
-    highlights = summary_generator.fetch_highlights(games_date)
-    standings = summary_generator.fetch_standings_changes()
-    return {"summaries" : summaries, "news" : news, "highlights" : highlights, "standings" : standings}
\ No newline at end of file
+async def fetchsummaries(games_date: str, if_none_match: str = Header(None), if_modified_since: str = Header(None)):
+    # summaries, news, highlights, and standings updates for a date only change when the batch pipelines run,
+    # so they are served as one precomputed bundle cached in memory per date
+    digest = await run_blocking(digest_cache.get, games_date)
+    if( digest.not_modified(if_none_match, if_modified_since) ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=digest.headers())
+
+    return Response(content=digest.body, media_type="application/json", headers=digest.headers())
+
+
+@app.get("/standingschanges")
+async def standingschanges(window: int = None):
+    # standings movement over the last `window` days, or since the previous snapshot when no window is given
+    if( window is not None and window < 1 ):
+        raise HTTPException(status_code=400, detail="Window must be at least one day")
+
+    newsletter = await run_blocking(Newsletter)
+    return await run_blocking(newsletter.fetch_standings_changes, window)
+
+
+@app.post("/digest/invalidate")
+async def invalidate_digest(games_date: str = None, x_digest_token: str = Header(None)):
+    # called by the pipelines after they publish new data for a date
+    token = os.getenv('DIGEST_INVALIDATE_TOKEN')
+    if( not token or not x_digest_token or not hmac.compare_digest(token, x_digest_token) ):
+        raise HTTPException(status_code=403, detail="Invalid digest token")
+
+    digest_cache.invalidate(games_date)
+    return {"invalidated" : games_date if games_date else "all"}
+
+
+@app.post("/answer")
+async def answer(user_query: QueryBody):
+    # the classifier's query cache answers repeat non-player queries without calling the model at all
+    cached_type, embedding = await run_blocking(classifier.cache.lookup, user_query.q)
+    if( cached_type is not None and cached_type != "Player" ):
+        return {"query_type" : cached_type, "raw_stat" : 0, "stat_formatted" : "Null"}
+
+    # classify the query and answer it with a single model call
+    result = await run_blocking(tools.classify_and_run, user_query.q)
+    if( result["query_type"] not in QUERY_TYPES ):
+        raise HTTPException(status_code=422, detail="Server classification failure. Please try again later")
+
+    if( cached_type is None ):
+        await run_blocking(classifier.cache.put, user_query.q, result["query_type"], embedding)
+
+    # only single player queries are answered for now, everything else short-circuits
+    if( result["answer"] is None ):
+        return {"query_type" : result["query_type"], "raw_stat" : 0, "stat_formatted" : "Null"}
+
+    return {"query_type" : result["query_type"], **result["answer"]}
+
+
+@app.get("/metrics/nba")
+async def nba_metrics():
+    # per endpoint latency / error counts, circuit state and the current request rate for stats.nba.com
+    return {**get_nba_gateway().stats(), "store" : get_nba_store().stats()}
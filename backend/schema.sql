@@ -0,0 +1,20 @@
+-- tables and constraints the backend expects on top of the existing Supabase schema. safe to rerun
+
+-- one precomputed /fetchsummaries bundle per date, written by DailyDigest.materialize_digest
+create table if not exists "Daily Digests" (
+    date date primary key,
+    digest jsonb not null,
+    updated_at timestamptz not null default now()
+);
+
+-- BulkWriter upserts on SupabaseWriter.CONFLICT_KEYS, and postgres rejects an upsert (42P10) unless the
+-- conflict columns have a unique constraint or index. rows duplicated by runs from before the upserts have to be
+-- deleted before these indexes can be created
+alter table "News" add column if not exists story_id text;
+alter table "Highlights" add column if not exists post_id text;
+
+create unique index if not exists summaries_game_id_key on "Summaries" (game_id);
+create unique index if not exists team_snapshots_team_id_date_key on "Team Snapshots" (team_id, date);
+create unique index if not exists standings_date_key on "Standings" (date);
+create unique index if not exists news_story_id_key on "News" (story_id);
+create unique index if not exists highlights_post_id_key on "Highlights" (post_id);
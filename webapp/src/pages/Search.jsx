@@ -20,7 +20,8 @@ export default function Search() {
     const processQuery = async (e) => {
         // prevent the submit form event from reloading the browser
         e.preventDefault();
-        const apiRequest = await fetch(`http://127.0.0.1:8000/query`, {
+        // classify the query and fetch the answer in a single request
+        const apiRequest = await fetch(`http://127.0.0.1:8000/answer`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -30,25 +31,6 @@ export default function Search() {
             })
         });
         const res = await apiRequest.json();
-        const query_category = res.query_type
-
-        // call the tool endpoint w/ the query and the query category to fetch answer
-        answerQuery(query_category);
-    }
-
-    const answerQuery = async (query_category) => {
-        // prevent the submit form event from reloading the browser
-        const apiRequest = await fetch(`http://127.0.0.1:8000/usetool`, {
-            method: 'POST',
-            headers: {
-                'Content-Type' : 'application/json',
-            },
-            body: JSON.stringify({
-                'q' : searchQuery,
-                'q_type' : query_category
-            })
-        });
-        const res = await apiRequest.json();
 
         setFoundAnswer(true);
         setResponseName(res.player_name);